@@ -0,0 +1,34 @@
+import subprocess
+import sys
+
+
+def _import_time(module):
+	# The cumulative import time of a module in microseconds, as reported
+	# by python -X importtime in a fresh interpreter.
+	out = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+		capture_output=True, text=True, check=True).stderr
+	for line in out.splitlines():
+		fields = [f.strip() for f in line.split('|')]
+		if len(fields) == 3 and fields[2] == module:
+			return int(fields[1])
+
+
+class ImportTspop:
+	"""Startup cost of importing tspop."""
+
+	timeout = 120
+
+	def timeraw_import_tspop(self):
+		return "import tspop"
+
+	def track_importtime_tspop(self):
+		return _import_time('tspop')
+	track_importtime_tspop.unit = 'microseconds'
+
+	def track_importtime_tspop_modules(self):
+		# The number of modules loaded by importing tspop.
+		out = subprocess.run([sys.executable, '-c',
+			'import sys; n = len(sys.modules); import tspop; print(len(sys.modules) - n)'],
+			capture_output=True, text=True, check=True).stdout
+		return int(out)
+	track_importtime_tspop_modules.unit = 'modules'
@@ -0,0 +1,150 @@
+import tskit
+
+import tspop
+
+from .common import admixture_ts
+
+
+def _replace_parents_with_pops_copying(ts, census_nodes):
+	# The version 0.0.2 implementation, which copies the table collection
+	# twice and looks up populations one row at a time.
+	ancestor_table = ts.dump_tables().link_ancestors(
+		samples=ts.samples(), ancestors=census_nodes)
+	population_ids = ts.dump_tables().nodes.population
+	return tspop.PopAncestry(left=ancestor_table.left,
+		right=ancestor_table.right,
+		ancestor=ancestor_table.parent,
+		population=[population_ids[n] for n in ancestor_table.parent],
+		child=ancestor_table.child,
+		sample_nodes=ts.samples(),
+		sequence_length=ts.sequence_length)
+
+
+class ReplaceParentsWithPops:
+	"""Time and peak memory of linking samples to census populations."""
+
+	params = [100, 500]
+	param_names = ['num_samples']
+	timeout = 600
+
+	def setup(self, num_samples):
+		self.ts, census_time = admixture_ts(
+			num_samples, sequence_length=1e8, mutation_rate=5e-8)
+		self.census_nodes = tspop.__dict__['__get_census_nodes'](self.ts, census_time)[0]
+
+	def time_replace_parents_with_pops(self, num_samples):
+		tspop.__dict__['__replace_parents_with_pops'](self.ts, self.census_nodes)
+
+	def peakmem_replace_parents_with_pops(self, num_samples):
+		tspop.__dict__['__replace_parents_with_pops'](self.ts, self.census_nodes)
+
+	def time_replace_parents_with_pops_copying(self, num_samples):
+		_replace_parents_with_pops_copying(self.ts, self.census_nodes)
+
+	def peakmem_replace_parents_with_pops_copying(self, num_samples):
+		_replace_parents_with_pops_copying(self.ts, self.census_nodes)
+
+
+class ParallelGetPopAncestry:
+	"""Scaling of get_pop_ancestry with the number of worker processes."""
+
+	params = [None, 1, 2, 4, 8]
+	param_names = ['num_workers']
+	timeout = 900
+
+	def setup_cache(self):
+		return admixture_ts(1000, sequence_length=1e8)
+
+	def time_get_pop_ancestry(self, sim, num_workers):
+		ts, census_time = sim
+		tspop.get_pop_ancestry(ts, census_time, num_workers=num_workers)
+
+
+class MultiCensusGetPopAncestry:
+	"""A single by_census call against one get_pop_ancestry call per census."""
+
+	census_times = [100, 201, 400]
+	timeout = 600
+
+	def setup_cache(self):
+		ts, _ = admixture_ts(500, sequence_length=1e8,
+			extra_census_times=[100, 400])
+		return ts
+
+	def time_by_census(self, ts):
+		tspop.get_pop_ancestry(ts, self.census_times, by_census=True)
+
+	def time_separate_calls(self, ts):
+		for census_time in self.census_times:
+			tspop.get_pop_ancestry(ts, census_time)
+
+	def peakmem_by_census(self, ts):
+		tspop.get_pop_ancestry(ts, self.census_times, by_census=True)
+
+	def peakmem_separate_calls(self, ts):
+		for census_time in self.census_times:
+			tspop.get_pop_ancestry(ts, census_time)
+
+
+class ProfiledGetPopAncestry:
+	"""Overhead of recording the stages of get_pop_ancestry."""
+
+	params = [False, True]
+	param_names = ['profile']
+	timeout = 600
+
+	def setup_cache(self):
+		return admixture_ts(500, sequence_length=1e8)
+
+	def time_get_pop_ancestry(self, sim, profile):
+		ts, census_time = sim
+		tspop.get_pop_ancestry(ts, census_time, profile=profile).squashed_table
+
+	def time_get_pop_ancestry_progress(self, sim, profile):
+		ts, census_time = sim
+		tspop.get_pop_ancestry(ts, census_time, profile=profile,
+			progress=lambda record: None).squashed_table
+
+
+class DumpPopAncestry:
+	"""Peak memory of writing the output to disk in batches of samples."""
+
+	params = [None, 2**24, 2**26]
+	param_names = ['memory_budget']
+	timeout = 900
+
+	def setup_cache(self):
+		ts, census_time = admixture_ts(1000, sequence_length=1e8)
+		ts.dump('admixture.trees')
+		return census_time
+
+	def time_dump_pop_ancestry(self, census_time, memory_budget):
+		if memory_budget is None:
+			tspop.get_pop_ancestry(tskit.load('admixture.trees'), census_time).dump('out')
+		else:
+			tspop.dump_pop_ancestry('admixture.trees', census_time, 'out',
+				memory_budget=memory_budget)
+
+	def peakmem_dump_pop_ancestry(self, census_time, memory_budget):
+		self.time_dump_pop_ancestry(census_time, memory_budget)
+
+
+class CommandLine:
+	"""Processing many files with the command line program."""
+
+	params = [1, 2, 4]
+	param_names = ['num_workers']
+	timeout = 900
+
+	def setup_cache(self):
+		paths = []
+		for j in range(8):
+			ts, census_time = admixture_ts(100, sequence_length=1e8, seed=j + 1)
+			paths.append(f'sim{j}.trees')
+			ts.dump(paths[-1])
+		return paths, census_time
+
+	def time_main(self, cache, num_workers):
+		paths, census_time = cache
+		tspop.main(paths + ['-c', str(census_time), '-o', 'out',
+			'-j', str(num_workers)])
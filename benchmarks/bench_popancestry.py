@@ -0,0 +1,173 @@
+import numpy as np
+
+import tspop
+
+from .common import admixture_ts, random_ancestry_table
+
+
+class ConstructPopAncestry:
+	"""Construction cost of a PopAncestry from raw link_ancestors columns."""
+
+	params = [1000, 20000]
+	param_names = ['num_samples']
+	timeout = 300
+
+	def setup(self, num_samples):
+		t = random_ancestry_table(num_samples, tracts_per_sample=500)
+		self.columns = {k: t[k].to_numpy() for k in t}
+		self.num_samples = num_samples
+
+	def _construct(self):
+		c = self.columns
+		return tspop.PopAncestry(
+			left=c['left'], right=c['right'], population=c['population'],
+			ancestor=c['ancestor'], child=c['sample'],
+			sample_nodes=np.arange(self.num_samples), sequence_length=c['right'].max())
+
+	def time_construct(self, num_samples):
+		self._construct()
+
+	def peakmem_construct(self, num_samples):
+		self._construct()
+
+	def time_construct_and_ancestry_fraction(self, num_samples):
+		self._construct().calculate_ancestry_fraction(0)
+
+	def peakmem_construct_and_ancestry_fraction(self, num_samples):
+		self._construct().calculate_ancestry_fraction(0)
+
+
+class CompactStorage:
+	"""Memory used by the default and compact storage of a PopAncestry."""
+
+	params = [[1000, 20000], [False, True]]
+	param_names = ['num_samples', 'compact']
+	timeout = 300
+
+	def setup(self, num_samples, compact):
+		t = random_ancestry_table(num_samples, tracts_per_sample=500)
+		self.columns = {k: t[k].to_numpy() for k in t}
+		self.num_samples = num_samples
+
+	def _construct(self, compact):
+		c = self.columns
+		return tspop.PopAncestry(
+			left=c['left'], right=c['right'], population=c['population'],
+			ancestor=c['ancestor'], child=c['sample'],
+			sample_nodes=np.arange(self.num_samples), sequence_length=c['right'].max(),
+			population_names=['pop0', 'pop1'] if compact else None, compact=compact)
+
+	def peakmem_construct_and_tables(self, num_samples, compact):
+		p = self._construct(compact)
+		p.ancestry_table
+		p.squashed_table
+
+	def track_bytes_per_row(self, num_samples, compact):
+		p = self._construct(compact)
+		return sum(getattr(p, n).nbytes for n in tspop._COLUMNS) / len(p.left)
+	track_bytes_per_row.unit = 'bytes'
+
+
+class LocalAncestryMatrix:
+	"""Export of a samples x positions local ancestry matrix."""
+
+	params = [1000, 10000]
+	param_names = ['num_positions']
+	timeout = 300
+
+	def setup(self, num_positions):
+		t = random_ancestry_table(1000, tracts_per_sample=500)
+		self.p = tspop.PopAncestry(
+			left=t['left'], right=t['right'], population=t['population'],
+			ancestor=t['ancestor'], child=t['sample'],
+			sample_nodes=np.arange(1000), sequence_length=t['right'].max())
+		self.p.squashed_table
+		rng = np.random.default_rng(1)
+		self.positions = np.sort(rng.uniform(0, t['right'].max(), num_positions))
+
+	def time_matrix(self, num_positions):
+		self.p.local_ancestry_matrix(self.positions)
+
+	def time_matrix_to_file(self, num_positions):
+		self.p.local_ancestry_matrix(self.positions, outfile='matrix.npy')
+
+	def peakmem_matrix_to_file(self, num_positions):
+		self.p.local_ancestry_matrix(self.positions, outfile='matrix.npy', block_size=100)
+
+	def time_runs(self, num_positions):
+		self.p.local_ancestry_runs(self.positions)
+
+	def time_local_ancestry_at(self, num_positions):
+		self.p.local_ancestry_at(self.positions)
+
+
+class WriteFormats:
+	"""Time and peak memory of the RFMix and VCF writers."""
+
+	timeout = 600
+
+	def setup_cache(self):
+		ts, census_time = admixture_ts(500, sequence_length=5e7, mutation_rate=2e-8)
+		return ts, tspop.get_pop_ancestry(ts, census_time)
+
+	def time_write_msp(self, sim):
+		ts, p = sim
+		p.write_msp('out.msp.tsv', ts)
+
+	def time_write_fb(self, sim):
+		ts, p = sim
+		p.write_fb('out.fb.tsv', ts)
+
+	def peakmem_write_fb(self, sim):
+		ts, p = sim
+		p.write_fb('out.fb.tsv', ts)
+
+	def time_write_vcf(self, sim):
+		ts, p = sim
+		p.write_vcf(ts, 'out.vcf')
+
+	def peakmem_write_vcf(self, sim):
+		ts, p = sim
+		p.write_vcf(ts, 'out.vcf')
+
+	def time_write_vcf_without_ancestry(self, sim):
+		ts, p = sim
+		with open('out.vcf', 'w') as f:
+			ts.write_vcf(f)
+
+
+class AncestorSharing:
+	"""Summaries of how census ancestors are shared across samples."""
+
+	params = [1000, 20000]
+	param_names = ['num_samples']
+	timeout = 300
+
+	def setup(self, num_samples):
+		t = random_ancestry_table(num_samples, tracts_per_sample=500)
+		self.p = tspop.PopAncestry(
+			left=t['left'], right=t['right'], population=t['population'],
+			ancestor=t['ancestor'], child=t['sample'],
+			sample_nodes=np.arange(num_samples), sequence_length=t['right'].max())
+
+	def _ancestor_summary(self):
+		# The coverage of each ancestor is cached, so it is cleared to
+		# time the calculation and not a cache hit.
+		self.p._ancestor_coverage = None
+		self.p.ancestor_summary()
+
+	def time_ancestor_summary(self, num_samples):
+		self._ancestor_summary()
+
+	def peakmem_ancestor_summary(self, num_samples):
+		self._ancestor_summary()
+
+	def time_ancestor_summary_groupby(self, num_samples):
+		t = self.p.ancestry_table.assign(length=lambda t: t.right - t.left)
+		t.groupby('ancestor').agg(population=('population', 'first'),
+			num_samples=('sample', 'nunique'), length=('length', 'sum'))
+
+	def peakmem_ancestor_summary_groupby(self, num_samples):
+		t = self.p.ancestry_table.assign(length=lambda t: t.right - t.left)
+		t.groupby('ancestor').agg(population=('population', 'first'),
+			num_samples=('sample', 'nunique'), length=('length', 'sum'))
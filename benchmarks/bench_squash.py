@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+import tspop
+
+from .common import random_ancestry_table
+
+
+def _squash_loop(ancestry_table):
+	# The row-by-row implementation used up to version 0.0.2.
+	new_sample = []
+	new_left = []
+	new_right = []
+	new_population = []
+	for ind, row in ancestry_table.iterrows():
+		if ind > 0 and row['left']==new_right[-1] and row['population'] == new_population[-1] and row['sample'] == new_sample[-1]:
+			new_right[-1] = row['right']
+		else:
+			new_sample.append(row['sample'])
+			new_left.append(row['left'])
+			new_right.append(row['right'])
+			new_population.append(row['population'])
+	return pd.DataFrame({
+		'sample': [int(i) for i in new_sample],
+		'left' : new_left,
+		'right': new_right,
+		'population' : [int(p) for p in new_population]
+	})
+
+
+class SquashAncestryTracts:
+	"""Compares the vectorised squashing engine with the old row loop."""
+
+	params = [10, 100]
+	param_names = ['num_samples']
+
+	def setup(self, num_samples):
+		t = random_ancestry_table(num_samples, tracts_per_sample=500)
+		self.p = tspop.PopAncestry(
+			left=t['left'], right=t['right'], population=t['population'],
+			ancestor=t['ancestor'], child=t['sample'],
+			sample_nodes=np.arange(num_samples), sequence_length=t['right'].max())
+
+	def time_vectorized(self, num_samples):
+		# The squashed columns are cached, so they are cleared to time the
+		# squash itself and not just building the table.
+		self.p._squashed_columns = None
+		self.p._squash_ancestry_tracts()
+
+	def time_loop(self, num_samples):
+		_squash_loop(self.p.ancestry_table)
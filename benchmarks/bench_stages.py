@@ -0,0 +1,124 @@
+import os
+import tempfile
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+import tspop
+
+from .common import admixture_ts
+
+_get_census_nodes = tspop.__dict__['__get_census_nodes']
+
+
+class PipelineStages:
+	"""
+	Time and peak memory of each stage of the tspop pipeline, over a grid
+	of simulations.
+	"""
+
+	params = [[20, 200], [1e7, 1e8], [1e-8, 3e-8]]
+	param_names = ['num_samples', 'sequence_length', 'recombination_rate']
+	timeout = 600
+
+	def setup_cache(self):
+		sims = {}
+		for num_samples in self.params[0]:
+			for sequence_length in self.params[1]:
+				for recombination_rate in self.params[2]:
+					sims[(num_samples, sequence_length, recombination_rate)] = admixture_ts(
+						num_samples, sequence_length, recombination_rate)
+		return sims
+
+	def setup(self, sims, num_samples, sequence_length, recombination_rate):
+		self.ts, self.census_time = sims[(num_samples, sequence_length, recombination_rate)]
+		self.census_nodes, _ = _get_census_nodes(self.ts, self.census_time)
+		links = self.ts.link_ancestors(self.ts.samples(), self.census_nodes)
+		self.columns = {
+			'left': links.left,
+			'right': links.right,
+			'ancestor': links.parent,
+			'population': self.ts.nodes_population[links.parent],
+			'child': links.child
+		}
+		self.p = self._construct()
+		self.p._get_squashed_columns()
+		self.subset = self.ts.samples()[: num_samples // 2]
+		self.tmpdir = tempfile.TemporaryDirectory()
+
+	def teardown(self, sims, *params):
+		self.tmpdir.cleanup()
+		plt.close('all')
+
+	def _construct(self):
+		return tspop.PopAncestry(
+			sample_nodes=self.ts.samples(),
+			sequence_length=self.ts.sequence_length,
+			**self.columns)
+
+	def _link_ancestors(self):
+		self.ts.link_ancestors(self.ts.samples(), self.census_nodes)
+
+	def _squash(self):
+		# Stages read cached results after their first call, so the caches
+		# are cleared to time the calculation itself.
+		self.p._squashed_columns = None
+		self.p._squash_ancestry_tracts()
+
+	def _ancestry_fraction(self):
+		self.p._ancestry_coverage = None
+		for population in self.p.ancestral_pops:
+			self.p.calculate_ancestry_fraction(population)
+
+	def _plot(self):
+		self.p.plot_karyotypes(self.ts.samples()[:2],
+			outfile=os.path.join(self.tmpdir.name, 'karyotype.png'))
+
+	def time_get_census_nodes(self, *args):
+		_get_census_nodes(self.ts, self.census_time)
+
+	def peakmem_get_census_nodes(self, *args):
+		_get_census_nodes(self.ts, self.census_time)
+
+	def time_link_ancestors(self, *args):
+		self._link_ancestors()
+
+	def peakmem_link_ancestors(self, *args):
+		self._link_ancestors()
+
+	def time_construct(self, *args):
+		self._construct()
+
+	def peakmem_construct(self, *args):
+		self._construct()
+
+	def time_squash_ancestry_tracts(self, *args):
+		self._squash()
+
+	def peakmem_squash_ancestry_tracts(self, *args):
+		self._squash()
+
+	def time_calculate_ancestry_fraction(self, *args):
+		self._ancestry_fraction()
+
+	def peakmem_calculate_ancestry_fraction(self, *args):
+		self._ancestry_fraction()
+
+	def time_subset_tables(self, *args):
+		self.p.subset_tables(self.subset)
+
+	def peakmem_subset_tables(self, *args):
+		self.p.subset_tables(self.subset)
+
+	def time_plot_karyotypes(self, *args):
+		self._plot()
+
+	def peakmem_plot_karyotypes(self, *args):
+		self._plot()
+
+	def time_get_pop_ancestry(self, *args):
+		tspop.get_pop_ancestry(self.ts, self.census_time)
+
+	def peakmem_get_pop_ancestry(self, *args):
+		tspop.get_pop_ancestry(self.ts, self.census_time)
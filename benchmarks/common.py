@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+
+def random_ancestry_table(num_samples, tracts_per_sample, num_pops=2, seed=1):
+	"""
+	Returns a sorted ancestry table with contiguous random tracts for each
+	sample, similar to the raw output of :meth:`tspop.get_pop_ancestry`.
+	"""
+	rng = np.random.default_rng(seed)
+	num_rows = num_samples * tracts_per_sample
+	sample = np.repeat(np.arange(num_samples, dtype=np.int32), tracts_per_sample)
+	lengths = rng.integers(1, 1000, size=num_rows).astype(np.float64)
+	right = np.cumsum(lengths.reshape(num_samples, tracts_per_sample), axis=1).ravel()
+	left = right - lengths
+	population = rng.integers(0, num_pops, size=num_rows, dtype=np.int32)
+	ancestor = rng.integers(0, 1000, size=num_rows, dtype=np.int32)
+	return pd.DataFrame({
+		'left': left,
+		'right': right,
+		'ancestor': ancestor,
+		'population': population,
+		'sample': sample
+	})
+
+
+def admixture_ts(num_samples, sequence_length, recombination_rate=3e-8,
+		mutation_rate=None, seed=1008, extra_census_times=()):
+	"""
+	Simulates an admixed population with a census at time 201, like the
+	example in the documentation, and at any ``extra_census_times``.
+	Returns the tree sequence and census time.
+	"""
+	import msprime
+	census_time = 201
+	demography = msprime.Demography()
+	demography.add_population(name="SMALL", initial_size=200)
+	demography.add_population(name="BIG", initial_size=500)
+	demography.add_population(name="ADMIX", initial_size=200)
+	demography.add_population(name="ANC", initial_size=500)
+	demography.add_admixture(
+		time=200, derived="ADMIX", ancestral=["SMALL", "BIG"],
+		proportions=[0.5, 0.5])
+	demography.add_census(time=census_time)
+	for time in extra_census_times:
+		demography.add_census(time=time)
+	demography.add_population_split(
+		time=600, derived=["SMALL", "BIG"], ancestral="ANC")
+	demography.sort_events()
+	ts = msprime.sim_ancestry(
+		samples={"SMALL": 0, "BIG": 0, "ADMIX": num_samples},
+		demography=demography,
+		random_seed=seed,
+		sequence_length=sequence_length,
+		recombination_rate=recombination_rate)
+	if mutation_rate is not None:
+		ts = msprime.sim_mutations(ts, rate=mutation_rate, random_seed=seed)
+	return ts, census_time
@@ -26,6 +26,9 @@ setup(
 		"Intended Audience :: Science/Research",
 		"Natural Language :: English"
 	],
+	entry_points = {
+		"console_scripts" : ["tspop=tspop:main"]
+	},
 	long_description = long_description,
 	long_description_content_type = "text/x-rst",
 	install_requires = [
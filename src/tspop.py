@@ -1,49 +1,1040 @@
+import concurrent.futures
+import contextlib
+import gzip
+import itertools
+import json
+import os
+import shutil
+import sys
+import time
+import tracemalloc
+try:
+	import resource
+except ImportError:
+	resource = None
 
 import tskit
-import pandas as pd
 import numpy as np
+# pandas and matplotlib are imported by the functions that use them,
+# so that importing tspop stays fast.
 
-import matplotlib.pyplot as plt
-from matplotlib.patches import Polygon
+_FORMAT_NAME = 'tspop.PopAncestry'
+_FORMAT_VERSION = 1
+_METADATA_FILE = 'metadata.json'
+_COLUMNS = ('sample', 'left', 'right', 'ancestor', 'population')
+# The number of matrix entries filled at a time by local_ancestry_matrix.
+_MATRIX_BLOCK_CELLS = 2**24
+# An estimate of the memory used for each row of output while a batch of
+# samples is processed by dump_pop_ancestry, in bytes. Most of it is used
+# inside link_ancestors.
+_BATCH_BYTES_PER_ROW = 2048
+# The number of samples in the first batch of dump_pop_ancestry, which is
+# used to estimate the number of rows per sample.
+_FIRST_BATCH_SIZE = 16
+_SQUASHED_COLUMNS = ('sample', 'left', 'right', 'population')
 
-def get_pop_ancestry(ts, census_time):
+def get_pop_ancestry(ts, census_time, tolerance=0, windows=None, num_workers=None,
+	compact=False, integer_coordinates=False, by_census=False, profile=False,
+	progress=None, samples=None):
 	"""
 	Creates a :class:`tspop.PopAncestry` object from a simulated tree sequence containing
 	ancestral census nodes. These are the ancestors that population-based
 	ancestry will be calculated with respect to.
 
+	If several census times are given, each segment of sample genome is
+	assigned to the most recent census node it inherits from, unless
+	``by_census`` is True.
+
 	:param tskit.TreeSequence ts: A tree sequence containing census nodes.
-	:param census_time: The time at which the census nodes are recorded.
-	:type census_time: list(int)
-	:returns: a :class:`tspop.PopAncestry` object
+	:param census_time: The time (or times) at which the census nodes are recorded.
+	:type census_time: int or list(int)
+	:param tolerance: Nodes whose time is within this distance of a census time
+		are treated as census nodes. Defaults to 0 (exact matches only).
+	:type tolerance: float
+	:param windows: If given, ``link_ancestors`` is run separately on each of these
+		genomic windows (see :meth:`tspop.iter_pop_ancestry`), which lowers its
+		peak memory usage. The output is the same.
+	:type windows: list(float)
+	:param num_workers: If given, the samples are split into this many batches,
+		which are processed in parallel by a pool of worker processes.
+		The output is the same as when running in a single process.
+	:type num_workers: int
+	:param compact: Whether to store the output in compact form, with population
+		names taken from the tree sequence (see :ref:`compactstorage`).
+		Defaults to False.
+	:type compact: bool
+	:param integer_coordinates: Whether to store coordinates as integers
+		in compact form. Defaults to False.
+	:type integer_coordinates: bool
+	:param by_census: If True, the ancestry is calculated separately with
+		reference to each of the census times, using a single run of
+		``link_ancestors``. Cannot be combined with ``windows`` or
+		``num_workers``. Defaults to False.
+	:type by_census: bool
+	:param profile: If True, the wall time, number of output rows and peak
+		memory of each stage of the calculation are recorded in the
+		:attr:`tspop.PopAncestry.profile` of the output (see :ref:`profiling`).
+		Defaults to False.
+	:type profile: bool
+	:param progress: If given, a function that is called with the record of
+		each stage of the calculation as it finishes.
+	:type progress: callable
+	:param samples: The sample nodes to calculate ancestry for. If None,
+		defaults to all samples in the tree sequence.
+	:type samples: list(int)
+	:returns: a :class:`tspop.PopAncestry` object or, if ``by_census`` is
+		True, a dictionary mapping each census time to a
+		:class:`tspop.PopAncestry` object
 	"""
+	profiler = None
+	if profile or progress is not None:
+		profiler = _Profiler(progress, trace_memory=profile)
+	with _profiling(profiler):
+		return _get_pop_ancestry(ts, census_time, tolerance, windows, num_workers,
+			compact, integer_coordinates, by_census, samples)
 
-	census_nodes = __get_census_nodes(ts, census_time)
-	pop_table = __replace_parents_with_pops(ts, census_nodes)
+def _get_pop_ancestry(ts, census_time, tolerance, windows, num_workers,
+	compact, integer_coordinates, by_census, samples):
+	if samples is None:
+		samples = ts.samples()
+	samples = np.asarray(samples, dtype=np.int32)
+	if not np.all(np.isin(samples, ts.samples())):
+		raise ValueError("Not all of the given nodes are samples.")
+	with _stage('census_nodes') as record:
+		census_nodes, census_levels = __get_census_nodes(ts, census_time, tolerance)
+		record['rows'] = len(census_nodes)
+	if by_census:
+		if windows is not None or num_workers is not None:
+			raise ValueError("by_census cannot be combined with windows or num_workers.")
+		if integer_coordinates and not compact:
+			raise ValueError("Integer coordinates are only available in compact storage.")
+		out = _pop_ancestry_by_census(ts, census_time, census_nodes, census_levels,
+			samples)
+		if compact:
+			for pop_table in out.values():
+				with _stage('compact'):
+					pop_table._set_population_names(_population_names(ts))
+					pop_table._compact(integer_coordinates)
+		return out
+	if windows is not None:
+		windows = _check_windows(windows, ts.sequence_length)
+	if num_workers is not None:
+		pop_table = _parallel_pop_ancestry(ts, census_nodes, windows, num_workers,
+			samples)
+	elif windows is not None:
+		columns = _sample_columns(ts, samples, census_nodes, windows)
+		pop_table = _pop_ancestry_from_columns(ts, columns, samples)
+	else:
+		pop_table = __replace_parents_with_pops(ts, census_nodes, samples)
+	if compact:
+		with _stage('compact'):
+			pop_table._set_population_names(_population_names(ts))
+			pop_table._compact(integer_coordinates)
+	elif integer_coordinates:
+		raise ValueError("Integer coordinates are only available in compact storage.")
 	return pop_table
 
-def __get_census_nodes(ts, census_time):
-	census_nodes = [u.id for u in ts.nodes() if u.time == census_time]
-	return census_nodes
+def iter_pop_ancestry(ts, census_time, windows, tolerance=0, samples=None):
+	"""
+	Calculates population-based ancestry one genomic window at a time,
+	yielding a :class:`tspop.PopAncestry` object for each window. Only the
+	edges overlapping the current window are held in memory.
 
-def __replace_parents_with_pops(ts, census_nodes):
-	ancestor_table = ts.tables.link_ancestors(
-		samples=ts.samples(), 
-		ancestors=census_nodes
-		)
-		
-	population_ids = ts.tables.nodes.population
-	local_ancestry = PopAncestry(left=ancestor_table.left,
-		right=ancestor_table.right,
-		ancestor=ancestor_table.parent,
-		population=[population_ids[n] for n in ancestor_table.parent],
-		child=ancestor_table.child,
-		sample_nodes=ts.samples(), # May not be in the child field!
+	Tracts are never split at window boundaries: a tract that continues
+	into the next window is held back and yielded, in full, with the
+	window in which it ends. Concatenating the columns of all the yielded
+	objects therefore gives the output of :meth:`tspop.get_pop_ancestry`.
+
+	:param tskit.TreeSequence ts: A tree sequence containing census nodes.
+	:param census_time: The time (or times) at which the census nodes are recorded.
+	:type census_time: int or list(int)
+	:param windows: Increasing breakpoints of the genomic windows, starting at 0
+		and ending at the sequence length.
+	:type windows: list(float)
+	:param tolerance: See :meth:`tspop.get_pop_ancestry`.
+	:type tolerance: float
+	:param samples: The sample nodes to calculate ancestry for. If None,
+		defaults to all samples in the tree sequence.
+	:type samples: list(int)
+	:returns: an iterator over :class:`tspop.PopAncestry` objects.
+	"""
+	windows = _check_windows(windows, ts.sequence_length)
+	census_nodes, _ = __get_census_nodes(ts, census_time, tolerance)
+	if samples is None:
+		samples = ts.samples()
+	samples = np.asarray(samples, dtype=np.int32)
+	for columns in _iter_window_columns(ts, census_nodes, windows, samples):
+		yield _pop_ancestry_from_columns(ts, columns, samples)
+
+def dump_pop_ancestry(ts, census_time, path, tolerance=0, windows=None,
+	memory_budget=None, batch_size=None):
+	"""
+	Calculates population-based ancestry one batch of samples at a time,
+	writing the output of each batch to a directory in the format of
+	:meth:`tspop.PopAncestry.dump` before the next batch is started.
+	Only one batch of output is held in memory, so this can be used when
+	the output of :meth:`tspop.get_pop_ancestry` does not fit in memory.
+
+	The number of samples in each batch is chosen so that the memory used
+	for the output of the batch stays within ``memory_budget``, estimating
+	the number of output rows per sample from the previous batches.
+	The budget does not include the tree sequence itself: a path is read
+	in full with ``tskit.load``. Pass ``windows`` to also limit the memory
+	used by ``link_ancestors`` (see :meth:`tspop.iter_pop_ancestry`).
+
+	:param ts: A tree sequence containing census nodes, or the path of one.
+	:type ts: tskit.TreeSequence or str
+	:param census_time: The time (or times) at which the census nodes are recorded.
+	:type census_time: int or list(int)
+	:param path: The name of the output directory. It is created if it
+		does not exist, and existing files are overwritten.
+	:type path: str
+	:param tolerance: Nodes whose time is within this distance of a census time
+		are treated as census nodes. Defaults to 0 (exact matches only).
+	:type tolerance: float
+	:param windows: If given, ``link_ancestors`` is run separately on each of
+		these genomic windows for each batch.
+	:type windows: list(float)
+	:param memory_budget: The memory to use for the output of each batch,
+		in bytes. Defaults to 256 MiB.
+	:type memory_budget: int
+	:param batch_size: If given, the number of samples in each batch,
+		instead of choosing it from ``memory_budget``.
+	:type batch_size: int
+	:returns: a :class:`tspop.PopAncestry` object memory-mapped from the
+		output directory (see :meth:`tspop.load`).
+	"""
+	if not isinstance(ts, tskit.TreeSequence):
+		ts = tskit.load(ts)
+	if memory_budget is None:
+		memory_budget = 2**28
+	census_nodes, _ = __get_census_nodes(ts, census_time, tolerance)
+	if windows is not None:
+		windows = _check_windows(windows, ts.sequence_length)
+	samples = ts.samples()
+	# Batches of sorted samples, so that the output is written in order.
+	sorted_samples = np.sort(samples)
+
+	os.makedirs(path, exist_ok=True)
+	dtypes = {'left': np.float64, 'right': np.float64}
+	writer = _ColumnWriter(path, dict(
+		{n: dtypes.get(n, np.int32) for n in _COLUMNS},
+		**{'squashed_' + n: dtypes.get(n, np.int32) for n in _SQUASHED_COLUMNS}))
+	num_rows = 0
+	start = 0
+	while start < len(sorted_samples):
+		if batch_size is not None:
+			size = batch_size
+		elif start == 0:
+			size = _FIRST_BATCH_SIZE
+		else:
+			rows_per_sample = max(num_rows / start, 1)
+			size = int(memory_budget // (_BATCH_BYTES_PER_ROW * rows_per_sample))
+		batch = sorted_samples[start:start + max(size, 1)]
+		columns = _sample_columns(ts, batch, census_nodes, windows)
+		local_ancestry = _pop_ancestry_from_columns(ts, columns, batch)
+		writer.append(dict(
+			{n: getattr(local_ancestry, n) for n in _COLUMNS},
+			**{'squashed_' + n: c for n, c in zip(_SQUASHED_COLUMNS,
+				local_ancestry._get_squashed_columns())}))
+		num_rows += len(local_ancestry.sample)
+		start += len(batch)
+	writer.close()
+	np.save(os.path.join(path, 'samples.npy'), np.asarray(samples, dtype=np.int32))
+	_write_metadata(path, ts.sequence_length)
+	return load(path)
+
+class _ColumnWriter(object):
+	"""
+	Appends columns to raw binary files in a directory, and converts them
+	to ``.npy`` files when closed, copying a buffer at a time.
+	"""
+	def __init__(self, path, dtypes):
+		self.path = path
+		self.dtypes = {n: np.dtype(d) for n, d in dtypes.items()}
+		self.num_rows = dict.fromkeys(dtypes, 0)
+		self.files = {n: open(self._raw_path(n), 'wb') for n in dtypes}
+
+	def _raw_path(self, name):
+		return os.path.join(self.path, name + '.raw')
+
+	def append(self, columns):
+		for name, column in columns.items():
+			np.asarray(column, dtype=self.dtypes[name]).tofile(self.files[name])
+			self.num_rows[name] += len(column)
+
+	def close(self):
+		for name, f in self.files.items():
+			f.close()
+			with open(os.path.join(self.path, name + '.npy'), 'wb') as out:
+				np.lib.format.write_array_header_1_0(out, {
+					'descr': np.lib.format.dtype_to_descr(self.dtypes[name]),
+					'fortran_order': False,
+					'shape': (self.num_rows[name],)
+				})
+				with open(self._raw_path(name), 'rb') as raw:
+					shutil.copyfileobj(raw, out)
+			os.remove(self._raw_path(name))
+
+def _write_metadata(path, sequence_length, metadata=None, keys=None,
+	key_name=None, key_offsets=None, compact=False, population_names=None):
+	with open(os.path.join(path, _METADATA_FILE), 'w') as f:
+		json.dump({
+			'format_name': _FORMAT_NAME,
+			'format_version': _FORMAT_VERSION,
+			'sequence_length': sequence_length,
+			'metadata': {} if metadata is None else metadata,
+			'keys': keys,
+			'key_name': key_name,
+			'key_offsets': None if keys is None else list(key_offsets),
+			'compact': compact,
+			'population_names': population_names
+		}, f)
+
+def _iter_window_columns(ts, census_nodes, windows, samples):
+	population_ids = _table_column(ts, 'nodes', 'population')
+	edge_left = _table_column(ts, 'edges', 'left')
+	edge_right = _table_column(ts, 'edges', 'right')
+	edge_parent = _table_column(ts, 'edges', 'parent')
+	edge_child = _table_column(ts, 'edges', 'child')
+
+	# A table collection holding the nodes and just one window of edges.
+	tables = tskit.TableCollection(sequence_length=ts.sequence_length)
+	tables.nodes.set_columns(
+		flags=_table_column(ts, 'nodes', 'flags'),
+		time=_table_column(ts, 'nodes', 'time'),
+		population=population_ids)
+
+	carried = None
+	for j in range(len(windows) - 1):
+		left, right = windows[j], windows[j + 1]
+		keep = (edge_left < right) & (edge_right > left)
+		tables.edges.set_columns(
+			left=np.maximum(edge_left[keep], left),
+			right=np.minimum(edge_right[keep], right),
+			parent=edge_parent[keep],
+			child=edge_child[keep])
+		with _stage('window', window=j, num_windows=len(windows) - 1) as record:
+			ancestor_table = tables.link_ancestors(
+				samples=samples, ancestors=census_nodes)
+			columns = _sample_links(ancestor_table, samples, population_ids)
+			# Holding back each sample's final tract needs sorted rows.
+			order = np.lexsort((columns['left'], columns['sample']))
+			columns = {k: v[order] for k, v in columns.items()}
+			if carried is not None:
+				columns = _join_at_seam(carried, columns, left)
+			if j < len(windows) - 2:
+				columns, carried = _hold_back_open_tracts(columns, right)
+			record['rows'] = len(columns['sample'])
+		yield columns
+
+def _parallel_pop_ancestry(ts, census_nodes, windows, num_workers, samples):
+	# Contiguous batches of sorted sample IDs, so that the concatenated
+	# output of the batches is already sorted.
+	batches = np.array_split(np.sort(samples), num_workers)
+	batches = [b for b in batches if len(b) > 0]
+	# The tree sequence is sent to each worker once, not once per batch.
+	with _stage('workers') as record, concurrent.futures.ProcessPoolExecutor(
+			max_workers=num_workers, initializer=_init_worker, initargs=(ts,)) as pool:
+		results = list(pool.map(_batch_columns, batches,
+			itertools.repeat(census_nodes), itertools.repeat(windows)))
+		record['rows'] = sum(len(r[0]['sample']) for r in results)
+	with _stage('concatenate'):
+		columns = _concatenate_columns([r[0] for r in results])
+	local_ancestry = _pop_ancestry_from_columns(ts, columns, samples)
+	local_ancestry._squashed_columns = tuple(
+		np.concatenate(c) for c in zip(*[r[1] for r in results]))
+	return local_ancestry
+
+_worker_ts = None
+
+def _init_worker(ts):
+	global _worker_ts, _profiler
+	_worker_ts = ts
+	# A forked worker inherits the profiler of the parent, whose records
+	# would never reach the caller.
+	_profiler = None
+
+def _batch_columns(samples, census_nodes, windows):
+	"""
+	Returns the sorted ancestry columns and the squashed columns for a
+	batch of samples, using the tree sequence held by this worker.
+	"""
+	ts = _worker_ts
+	columns = _sample_columns(ts, samples, census_nodes, windows)
+	local_ancestry = _pop_ancestry_from_columns(ts, columns, samples)
+	columns = {
+		'sample': local_ancestry.sample,
+		'left': local_ancestry.left,
+		'right': local_ancestry.right,
+		'ancestor': local_ancestry.ancestor,
+		'population': local_ancestry.population
+	}
+	return columns, local_ancestry._get_squashed_columns()
+
+def _sample_columns(ts, samples, census_nodes, windows):
+	"""
+	Returns the unsorted ancestry columns of the given samples, running
+	``link_ancestors`` once or, if ``windows`` are given, once per window.
+	"""
+	if windows is None:
+		return _sample_links(_link_ancestors(ts, samples, census_nodes),
+			samples, _table_column(ts, 'nodes', 'population'))
+	return _concatenate_columns(
+		list(_iter_window_columns(ts, census_nodes, windows, samples)))
+
+def _concatenate_columns(chunks):
+	return {k: np.concatenate([c[k] for c in chunks]) for k in chunks[0]}
+
+def _pop_ancestry_from_columns(ts, columns, samples=None):
+	if samples is None:
+		samples = ts.samples()
+	return PopAncestry(left=columns['left'],
+		right=columns['right'],
+		ancestor=columns['ancestor'],
+		population=columns['population'],
+		child=columns['sample'],
+		sample_nodes=samples, # May not be in the child field!
 		sequence_length=ts.sequence_length
 	)
 
+def load(path, mmap=True):
+	"""
+	Loads a :class:`tspop.PopAncestry` object saved with
+	:meth:`tspop.PopAncestry.dump`.
+
+	:param path: The directory the object was saved to.
+	:type path: str
+	:param mmap: Whether to memory-map the columns instead of reading them
+		into memory. If True, a column is only read from disk when it is
+		used. Defaults to True.
+	:type mmap: bool
+	:returns: a :class:`tspop.PopAncestry` object
+	"""
+	with open(os.path.join(path, _METADATA_FILE)) as f:
+		header = json.load(f)
+	if header.get('format_name') != _FORMAT_NAME:
+		raise ValueError("This directory does not contain a saved PopAncestry.")
+	if header['format_version'] > _FORMAT_VERSION:
+		raise ValueError("This file was saved by a newer version of tspop.")
+
+	mmap_mode = 'r' if mmap else None
+	def column(name):
+		return np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+
+	# The saved columns are already sorted, so the constructor is bypassed
+	# to avoid reading them in full.
+	local_ancestry = PopAncestry._from_sorted_columns(
+		{name: column(name) for name in _COLUMNS},
+		column('samples'), header['sequence_length'], header['metadata'])
+	local_ancestry._squashed_columns = tuple(column('squashed_' + name)
+		for name in ('sample', 'left', 'right', 'population'))
+	if header.get('keys') is not None:
+		local_ancestry._set_keys(header['keys'], header['key_name'],
+			np.array(header['key_offsets']))
+	local_ancestry.compact = header.get('compact', False)
+	local_ancestry.population_names = header.get('population_names')
+	return local_ancestry
+
+def concat(pop_ancestries, keys=None, key_name='key'):
+	"""
+	Combines several :class:`tspop.PopAncestry` objects into one.
+
+	Without ``keys``, the objects must describe the same sequence. They may
+	hold different samples, or different parts of the genomes of the same
+	samples (for example, the output of :meth:`tspop.iter_pop_ancestry`), but
+	the tracts of a sample must not overlap. Tracts that meet at the
+	boundary between two objects are joined in the squashed table.
+
+	With ``keys``, each object is treated as a separate sequence (for example,
+	a chromosome or a simulation replicate). These are laid end to end in
+	a single coordinate system, and the tables gain a column with each
+	tract's key, with coordinates given relative to the start of the key's
+	sequence. Tracts are never joined across keys.
+
+	The squashed table of the result is made by sorting the squashed tracts
+	of all the inputs together and joining the tracts that meet, which is
+	faster than squashing the combined ancestry table when the inputs have
+	already been squashed. The summaries of the result are combined from
+	the summaries of the inputs.
+
+	:param pop_ancestries: The objects to combine.
+	:type pop_ancestries: list(tspop.PopAncestry)
+	:param keys: A label for each object, such as a chromosome name.
+	:type keys: list
+	:param key_name: The label of the key column in the tables.
+	:type key_name: str
+	:returns: a :class:`tspop.PopAncestry` object
+	"""
+	import pandas as pd
+	pop_ancestries = list(pop_ancestries)
+	if len(pop_ancestries) == 0:
+		raise ValueError("At least one PopAncestry object must be given.")
+	if any(p.keys is not None for p in pop_ancestries):
+		raise ValueError("Objects that already have keys cannot be combined.")
+	lengths = np.array([p._sequence_length for p in pop_ancestries], dtype=np.float64)
+	if keys is None:
+		if np.any(lengths != lengths[0]):
+			raise ValueError("Without keys, all objects must have the same sequence length.")
+		sequence_length = lengths[0]
+		offsets = np.zeros(len(pop_ancestries))
+	else:
+		keys = np.asarray(keys).tolist()
+		if len(keys) != len(pop_ancestries):
+			raise ValueError("There must be one key for each object.")
+		key_offsets = np.append(0, np.cumsum(lengths))
+		sequence_length = key_offsets[-1]
+		offsets = key_offsets[:-1]
+
+	def combine(get_columns, names):
+		chunks = [get_columns(p) for p in pop_ancestries]
+		columns = {n: np.concatenate([c[i] for c in chunks])
+			for i, n in enumerate(names)}
+		for n in ('left', 'right'):
+			columns[n] = columns[n] + np.repeat(offsets, [len(c[0]) for c in chunks])
+		order = np.lexsort((columns['left'], columns['sample']))
+		return {n: v[order] for n, v in columns.items()}
+
+	columns = combine(lambda p: [getattr(p, n) for n in _COLUMNS], _COLUMNS)
+	same_sample = columns['sample'][1:] == columns['sample'][:-1]
+	if np.any(same_sample & (columns['right'][:-1] > columns['left'][1:])):
+		raise ValueError("The tracts of a sample overlap between the objects.")
+	samples = pd.unique(np.concatenate(
+		[np.asarray(p.samples, dtype=np.int32) for p in pop_ancestries]))
+	local_ancestry = PopAncestry._from_sorted_columns(
+		columns, samples, sequence_length)
+	if keys is not None:
+		local_ancestry._set_keys(keys, key_name, key_offsets)
+
+	# The squashed tracts of each input are already joined, so only tracts
+	# from different inputs can meet, but all of them are sorted and scanned.
+	squashed_names = ('sample', 'left', 'right', 'population')
+	squashed = combine(lambda p: p._get_squashed_columns(), squashed_names)
+	run_keys = [squashed['sample'], squashed['population']]
+	if keys is not None:
+		run_keys.append(local_ancestry._key_index(squashed['left']))
+	starts, ends = _find_runs(squashed['left'], squashed['right'], *run_keys)
+	local_ancestry._squashed_columns = (
+		squashed['sample'][starts],
+		squashed['left'][starts],
+		squashed['right'][ends],
+		squashed['population'][starts]
+	)
+
+	# Combine the summaries of the inputs.
+	local_ancestry._ancestors = np.unique(np.concatenate(
+		[np.asarray(p.ancestors, dtype=np.int32) for p in pop_ancestries])).tolist()
+	local_ancestry._ancestral_pops = np.unique(np.concatenate(
+		[np.asarray(p.ancestral_pops, dtype=np.int32) for p in pop_ancestries])).tolist()
+	local_ancestry._coverage = sum(p.coverage for p in pop_ancestries)
+
+	names = [p.population_names for p in pop_ancestries]
+	if all(n == names[0] for n in names):
+		local_ancestry.population_names = names[0]
+	if all(p.compact for p in pop_ancestries):
+		local_ancestry._compact(integer_coordinates=all(
+			p.left.dtype.kind == 'u' for p in pop_ancestries))
+	return local_ancestry
+
+def _check_windows(windows, sequence_length):
+	windows = np.asarray(windows, dtype=np.float64)
+	if (len(windows) < 2 or windows[0] != 0 or windows[-1] != sequence_length
+			or np.any(np.diff(windows) <= 0)):
+		raise ValueError("Windows must be increasing breakpoints starting at 0 "
+			"and ending at the sequence length.")
+	return windows
+
+def _sample_links(ancestor_table, samples, population_ids):
+	"""
+	Returns the columns of the rows of a ``link_ancestors`` output table
+	whose child is a sample, labelled with the population of the parent.
+	"""
+	child = ancestor_table.child
+	parent = ancestor_table.parent
+	# With several census times, some rows link one census node to another.
+	is_sample = np.zeros(len(population_ids), dtype=bool)
+	is_sample[samples] = True
+	keep = is_sample[child]
+	parent = parent[keep]
+	return {
+		'sample': child[keep],
+		'left': ancestor_table.left[keep],
+		'right': ancestor_table.right[keep],
+		'ancestor': parent,
+		'population': population_ids[parent]
+	}
+
+def _join_at_seam(carried, columns, seam):
+	"""
+	Combines the rows held back from the previous window with the rows of
+	the current window, joining rows from the same ancestor that meet at
+	the window boundary.
+	"""
+	columns = {k: np.concatenate([carried[k], columns[k]]) for k in columns}
+	order = np.lexsort((columns['left'], columns['sample']))
+	columns = {k: v[order] for k, v in columns.items()}
+	return _join_runs(columns, 'sample', 'ancestor', seams=[seam])
+
+def _hold_back_open_tracts(columns, boundary):
+	"""
+	Splits the columns into the rows of completed tracts and the rows of
+	each sample's final tract, if that tract reaches the window boundary.
+	"""
+	sample = columns['sample']
+	starts, ends = _find_runs(columns['left'], columns['right'],
+		sample, columns['population'])
+	last_in_sample = np.append(sample[ends[:-1]] != sample[starts[1:]], True)[:len(ends)]
+	held_runs = last_in_sample & (columns['right'][ends] == boundary)
+	held = np.repeat(held_runs, ends - starts + 1)
+	done = {k: v[~held] for k, v in columns.items()}
+	carried = {k: v[held] for k, v in columns.items()}
+	return done, carried
+
+def __get_census_nodes(ts, census_time, tolerance=0):
+	"""
+	Returns the IDs of the census nodes and, for each of them, the index of
+	its nearest census time in the sorted census times.
+	"""
+	census_times = np.unique(np.asarray(census_time, dtype=np.float64).ravel())
+	if len(census_times) == 0:
+		raise ValueError("At least one census time must be given.")
+	node_times = _table_column(ts, 'nodes', 'time')
+	# Distance from each node to its nearest census time.
+	i = np.searchsorted(census_times, node_times)
+	below = np.maximum(i - 1, 0)
+	above = np.minimum(i, len(census_times) - 1)
+	below_distance = np.abs(node_times - census_times[below])
+	above_distance = np.abs(node_times - census_times[above])
+	distance = np.minimum(below_distance, above_distance)
+	census_nodes = np.flatnonzero(distance <= tolerance).astype(np.int32)
+	nearest = np.where(below_distance <= above_distance, below, above)
+	return census_nodes, nearest[census_nodes].astype(np.int32)
+
+def _pop_ancestry_by_census(ts, census_time, census_nodes, census_levels, samples):
+	"""
+	Returns a dictionary mapping each census time to a
+	:class:`tspop.PopAncestry` object, using a single ``link_ancestors``
+	table linking the samples to the census nodes of all the census times.
+	"""
+	census_times = np.unique(np.asarray(census_time, dtype=np.float64).ravel())
+	# The index of the census time of each node, or -1 for other nodes.
+	levels = np.full(ts.num_nodes, -1, dtype=np.int32)
+	levels[census_nodes] = census_levels
+	population_ids = _table_column(ts, 'nodes', 'population')
+	with _stage('link_ancestors') as record:
+		ancestor_table = _link_ancestors(ts, samples, census_nodes)
+		record['rows'] = ancestor_table.num_rows
+	links = _sort_links({
+		'child': ancestor_table.child,
+		'left': ancestor_table.left,
+		'right': ancestor_table.right,
+		'parent': ancestor_table.parent
+	})
+	is_census = levels >= 0
+	node_links = {k: v[is_census[links['child']]] for k, v in links.items()}
+	links = {k: v[~is_census[links['child']]] for k, v in links.items()}
+	out = {}
+	for level, time in enumerate(census_times):
+		# Links to more recent census nodes are followed to this census.
+		with _stage('follow_links', census_time=float(time)) as record:
+			links = _join_runs(_follow_links(links, levels >= level, node_links),
+				'child', 'parent')
+			record['rows'] = len(links['child'])
+		out[float(time)] = PopAncestry(left=links['left'],
+			right=links['right'],
+			ancestor=links['parent'],
+			population=population_ids[links['parent']],
+			child=links['child'],
+			sample_nodes=samples,
+			sequence_length=ts.sequence_length)
+	return out
+
+def __replace_parents_with_pops(ts, census_nodes, samples=None):
+	if samples is None:
+		samples = ts.samples()
+	with _stage('link_ancestors') as record:
+		ancestor_table = _link_ancestors(ts, samples, census_nodes)
+		record['rows'] = ancestor_table.num_rows
+	with _stage('sample_links') as record:
+		columns = _sample_links(
+			ancestor_table, samples, _table_column(ts, 'nodes', 'population'))
+		record['rows'] = len(columns['sample'])
+	local_ancestry = _pop_ancestry_from_columns(ts, columns, samples)
 	return local_ancestry
 
+def _link_ancestors(ts, samples, ancestors):
+	"""
+	Runs ``link_ancestors`` directly on the tree sequence where possible,
+	so that the table collection is not copied.
+	"""
+	try:
+		link_ancestors = ts.link_ancestors
+	except AttributeError:
+		link_ancestors = ts.dump_tables().link_ancestors
+	return link_ancestors(samples=samples, ancestors=ancestors)
+
+# The profiler of the running get_pop_ancestry call, if any.
+_profiler = None
+
+class _Profiler(object):
+	"""
+	Records the wall time, number of output rows and peak traced memory of
+	each stage of a calculation, and passes each record to ``progress``.
+	"""
+	def __init__(self, progress=None, trace_memory=True):
+		self.records = []
+		self.progress = progress
+		self.trace_memory = trace_memory
+
+	@contextlib.contextmanager
+	def stage(self, name, **info):
+		record = dict(stage=name, seconds=None, rows=None, peak_memory=None,
+			max_rss=None, **info)
+		# The peak of a tracing session started by the caller is left alone,
+		# so the peak memory of a stage is only measured if it starts tracing.
+		started = self.trace_memory and not tracemalloc.is_tracing()
+		if started:
+			tracemalloc.start()
+		start_time = time.perf_counter()
+		try:
+			yield record
+		finally:
+			record['seconds'] = time.perf_counter() - start_time
+			if started:
+				record['peak_memory'] = tracemalloc.get_traced_memory()[1]
+				tracemalloc.stop()
+			record['max_rss'] = _max_rss()
+		self.records.append(record)
+		if self.progress is not None:
+			self.progress(record)
+
+def _max_rss():
+	"""
+	Returns the largest resident set size of the process so far in bytes,
+	if the platform reports it.
+	"""
+	if resource is None:
+		return None
+	max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# Reported in bytes on macOS and in kilobytes elsewhere.
+	return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+@contextlib.contextmanager
+def _profiling(profiler):
+	global _profiler
+	previous, _profiler = _profiler, profiler
+	try:
+		yield
+	finally:
+		_profiler = previous
+
+def _stage(name, profiler=None, **info):
+	"""
+	Returns a context manager recording a stage with the given profiler,
+	or with the profiler of the running calculation. The record it yields
+	is a dictionary in which the number of output rows can be set.
+	"""
+	if profiler is None:
+		profiler = _profiler
+	if profiler is None:
+		return contextlib.nullcontext({})
+	return profiler.stage(name, **info)
+
+def _table_column(ts, table, name):
+	"""
+	Returns a column of one of the tree sequence's tables without copying
+	the table collection when the installed version of tskit allows it.
+	"""
+	try:
+		return getattr(ts, table + '_' + name)
+	except AttributeError:
+		return getattr(getattr(ts.tables, table), name)
+
+def _find_runs(left, right, *keys, seams=None):
+	"""
+	Returns the indices of the first and last rows of each run of contiguous
+	rows. The rows must be sorted by ``keys`` and then by ``left``. A new run
+	starts wherever one of the ``keys`` changes or wherever a row's left
+	coordinate does not match the previous row's right coordinate.
+	If ``seams`` is given, rows are only joined at these coordinates.
+	"""
+	num_rows = len(left)
+	breaks = np.ones(num_rows, dtype=bool)
+	if num_rows > 1:
+		breaks[1:] = left[1:] != right[:-1]
+		for k in keys:
+			breaks[1:] |= k[1:] != k[:-1]
+		if seams is not None:
+			breaks[1:] |= ~np.isin(left[1:], seams)
+	starts = np.flatnonzero(breaks)
+	ends = np.append(starts[1:] - 1, num_rows - 1)[:len(starts)]
+	return starts, ends
+
+def _join_runs(columns, *key_names, seams=None):
+	"""
+	Joins each run of contiguous rows with the same values in the
+	``key_names`` columns into a single row (see :func:`_find_runs`).
+	"""
+	starts, ends = _find_runs(columns['left'], columns['right'],
+		*[columns[k] for k in key_names], seams=seams)
+	right = columns['right'][ends]
+	columns = {k: v[starts] for k, v in columns.items()}
+	columns['right'] = right
+	return columns
+
+def _is_sorted(sample, left):
+	"""
+	Returns True if the rows are sorted by sample and then by left coordinate.
+	"""
+	if len(sample) < 2:
+		return True
+	ds = np.diff(sample)
+	return bool(np.all((ds > 0) | ((ds == 0) & (left[1:] > left[:-1]))))
+
+def _sample_offsets(sample):
+	"""
+	Returns the distinct sample IDs in a column sorted by sample, and the
+	offsets such that the rows of the i-th sample are
+	``offsets[i]:offsets[i + 1]``.
+	"""
+	ids, starts = np.unique(sample, return_index=True)
+	offsets = np.append(starts, len(sample)).astype(np.int64)
+	return ids, offsets
+
+def _covered_length(left, right, positions):
+	"""
+	Returns the total length of the intervals [``left``, ``right``) lying to
+	the left of each position, found with a sweep over the sorted breakpoints.
+	"""
+	if len(left) == 0:
+		return np.zeros(len(positions))
+	breakpoints = np.concatenate([left, right])
+	order = np.argsort(breakpoints, kind='stable')
+	breakpoints = breakpoints[order]
+	# The number of intervals covering the region just after each breakpoint.
+	depth = np.cumsum(np.concatenate([
+		np.ones(len(left)), -np.ones(len(right))])[order])
+	area = np.append(0, np.cumsum(depth[:-1] * np.diff(breakpoints)))
+	k = np.searchsorted(breakpoints, positions, side='right') - 1
+	covered = area[k] + depth[k] * (positions - breakpoints[k])
+	covered[k < 0] = 0
+	return covered
+
+def _narrow_int(column, dtypes):
+	"""
+	Returns the column as the first of the integer dtypes that can hold it.
+	"""
+	if len(column) > 0:
+		low, high = column.min(), column.max()
+		for dtype in dtypes[:-1]:
+			if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+				return column.astype(dtype, copy=False)
+	return column.astype(dtypes[-1] if len(column) > 0 else dtypes[0], copy=False)
+
+def _compact_columns(columns, sequence_length, integer_coordinates=False):
+	"""
+	Returns the columns converted to the narrowest dtypes that hold them.
+	"""
+	columns = dict(columns)
+	for name in ('sample', 'ancestor'):
+		columns[name] = _narrow_int(columns[name], (np.int16, np.int32))
+	columns['population'] = _narrow_int(
+		columns['population'], (np.int8, np.int16, np.int32))
+	if integer_coordinates:
+		dtype = np.uint32 if sequence_length <= np.iinfo(np.uint32).max else np.uint64
+		for name in ('left', 'right'):
+			if np.any(np.mod(columns[name], 1) != 0):
+				raise ValueError("All coordinates must be whole numbers "
+					"to be stored as integers.")
+			columns[name] = columns[name].astype(dtype, copy=False)
+	return columns
+
+def _population_names(ts):
+	"""
+	Returns the population names stored in the metadata of a tree sequence,
+	using pop0, pop1 etc. where no name is given.
+	"""
+	names = []
+	for pop in ts.populations():
+		md = pop.metadata
+		name = md.get('name') if isinstance(md, dict) else None
+		names.append(name if name is not None else f'pop{pop.id}')
+	return names
+
+def _check_positions(positions, sequence_length):
+	"""
+	Returns the positions as a sorted float array, taking them from the sites
+	table if a tree sequence is given.
+	"""
+	if isinstance(positions, tskit.TreeSequence):
+		positions = _table_column(positions, 'sites', 'position')
+	positions = np.asarray(positions, dtype=np.float64)
+	if np.any(positions < 0) or np.any(positions >= sequence_length):
+		raise ValueError("Positions must be within the sequence.")
+	if np.any(np.diff(positions) < 0):
+		raise ValueError("Positions must be sorted.")
+	return positions
+
+def _open_output(output, compression=None):
+	"""
+	Returns a context manager for writing text to the given path, compressed
+	with gzip or bgzip if asked. File objects are written to directly.
+	"""
+	if hasattr(output, 'write'):
+		return contextlib.nullcontext(output)
+	if compression is None:
+		return open(output, 'w')
+	if compression == 'gzip':
+		return gzip.open(output, 'wt')
+	if compression == 'bgzip':
+		try:
+			import pysam
+		except ImportError:
+			raise ImportError("Writing bgzip files requires pysam.")
+		return _TextWriter(pysam.BGZFile(str(output), 'wb'))
+	raise ValueError("compression must be None, 'gzip' or 'bgzip'.")
+
+class _TextWriter(object):
+	"""
+	Writes text to a binary file object, closing it on exit.
+	"""
+	def __init__(self, raw):
+		self.raw = raw
+
+	def write(self, text):
+		self.raw.write(text.encode())
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.raw.close()
+
+def _position_chunks(num_positions, num_columns, chunk_size=None):
+	"""
+	Returns slices of the positions such that a chunk of the local ancestry
+	matrix has about _MATRIX_BLOCK_CELLS entries.
+	"""
+	if chunk_size is None:
+		chunk_size = max(1, _MATRIX_BLOCK_CELLS // max(num_columns, 1))
+	return [slice(a, min(a + chunk_size, num_positions))
+		for a in range(0, num_positions, chunk_size)]
+
+def _genetic_positions(positions, rate_map):
+	if rate_map is None:
+		return np.full(len(positions), np.nan)
+	return 100 * rate_map.get_cumulative_mass(positions)
+
+def _vcf_haplotypes(ts, individuals=None, ploidy=None,
+	include_non_sample_nodes=False):
+	"""
+	Returns the nodes written to a VCF by ``ts.write_vcf``, in order,
+	and the number of nodes in each sample column.
+	"""
+	try:
+		model = ts.map_to_vcf_model(individuals=individuals, ploidy=ploidy,
+			include_non_sample_nodes=include_non_sample_nodes)
+		nodes = model.individuals_nodes
+	except AttributeError:
+		if individuals is None and ts.num_individuals > 0:
+			individuals = np.unique(_table_column(ts, 'nodes', 'individual')[ts.samples()])
+			individuals = individuals[individuals >= 0]
+		if individuals is not None:
+			nodes = [ts.individual(i).nodes for i in individuals]
+		else:
+			nodes = ts.samples().reshape(-1, 1 if ploidy is None else ploidy)
+	ploidies = np.array([np.sum(np.asarray(n) >= 0) for n in nodes], dtype=np.int64)
+	nodes = np.concatenate([np.asarray(n)[np.asarray(n) >= 0] for n in nodes])
+	# Individuals with no nodes are not written.
+	return nodes, ploidies[ploidies > 0]
+
+class _VcfAncestryWriter(object):
+	"""
+	A file object that adds an ANC FORMAT field to the VCF records written
+	to it by ``ts.write_vcf``, a chunk of records at a time.
+	"""
+	def __init__(self, output, pop_ancestry, positions, nodes, ploidies, chunk_size):
+		self.output = output
+		self.pop_ancestry = pop_ancestry
+		self.positions = positions
+		self.nodes = nodes
+		self.ploidies = ploidies
+		self.first = np.cumsum(ploidies) - ploidies
+		self.chunk_size = chunk_size
+		self.partial = []
+		self.records = []
+
+	def write(self, text):
+		if '\n' not in text:
+			self.partial.append(text)
+			return
+		self.partial.append(text)
+		lines = ''.join(self.partial).split('\n')
+		self.partial = [lines.pop()]
+		for line in lines:
+			if line.startswith('#'):
+				if line.startswith('#CHROM'):
+					self.output.write('##FORMAT=<ID=ANC,Number=.,Type=String,'
+						'Description="Population of the census ancestor of each haplotype">\n')
+				self.output.write(line + '\n')
+			else:
+				self.records.append(line)
+		if len(self.records) >= self.chunk_size:
+			self.flush()
+
+	def flush(self):
+		if len(self.records) == 0:
+			return
+		fields = [r.split('\t') for r in self.records]
+		site_ids = np.array([int(f[2]) for f in fields])
+		m = self.pop_ancestry.local_ancestry_matrix(self.positions[site_ids],
+			samples=self.nodes, dtype=np.int32)
+		labels = np.array([str(p) for p in range(max(m.max(initial=0), 0) + 1)] + ['.'],
+			dtype=object)
+		tokens = labels[m]
+		# The ancestry of each sample column, joined as for genotypes.
+		anc = tokens[self.first]
+		for h in range(1, self.ploidies.max()):
+			has = self.ploidies > h
+			anc[has] = anc[has] + '|' + tokens[self.first[has] + h]
+		cells = np.array([f[9:] for f in fields], dtype=object) + ':' + anc.T
+		out = ['\t'.join(f[:8] + [f[8] + ':ANC'] + c.tolist()) + '\n'
+			for f, c in zip(fields, cells)]
+		self.output.write(''.join(out))
+		self.records = []
+
+def _ranges_to_rows(starts, ends):
+	"""
+	Returns a slice, or an array of indices, selecting the rows in the
+	given ranges.
+	"""
+	keep = ends > starts
+	starts, ends = starts[keep], ends[keep]
+	if len(starts) == 0:
+		return slice(0, 0)
+	if np.all(starts[1:] == ends[:-1]):
+		return slice(starts[0], ends[-1])
+	counts = ends - starts
+	return np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(np.sum(counts))
+
+def _fill_values(size, num_columns, sample_index, lo, hi, population, missing, dtype):
+	"""
+	Returns the flattened rows of a local ancestry matrix block, made with a
+	single ``np.repeat`` of the alternating gaps and tracts of the rows, so
+	that the only temporary array the size of the block has the dtype of
+	the matrix.
+	"""
+	keep = hi > lo
+	offset = sample_index[keep] * num_columns
+	starts, ends = offset + lo[keep], offset + hi[keep]
+	values = np.full(2 * len(starts) + 1, missing, dtype=dtype)
+	values[1::2] = population[keep]
+	counts = np.empty(2 * len(starts) + 1, dtype=np.int64)
+	counts[0:-1:2] = starts - np.append(0, ends[:-1])
+	counts[1::2] = ends - starts
+	counts[-1] = size - (ends[-1] if len(ends) > 0 else 0)
+	return np.repeat(values, counts)
+
 class PopAncestry(object):
 	"""
 	In most cases, this should be created with the :meth:`tspop.get_pop_ancestry` method.
@@ -59,41 +1050,177 @@ class PopAncestry(object):
 	:type sample_nodes: list(int)
 	:arg sequence_length: The physical length of the region represented.
 	:type sequence_length: float
+	:arg metadata: Optional user metadata.
+	:type metadata: dict
+	:arg population_names: The names of the populations, indexed by population ID.
+		If given, the ``population`` columns of the tables are categorical
+		columns holding these names.
+	:type population_names: list(str)
+	:arg compact: Whether to store the data in compact form
+		(see :ref:`compactstorage`). Defaults to False.
+	:type compact: bool
+	:arg integer_coordinates: Whether to store the coordinates as unsigned
+		integers in compact form. All coordinates must be whole numbers.
+		Defaults to False.
+	:type integer_coordinates: bool
 
 	"""
 
 	def __init__(self, left, right, population, ancestor, child,
-		sample_nodes, sequence_length):
-		self.left = np.array(left, dtype=np.float64)
-		self.right = np.array(right, dtype=np.float64)
-		self.population = np.array(population, dtype=np.int32)
-		self.ancestor = np.array(ancestor, dtype=np.int32)
-		self.sample = np.array(child, dtype=np.int32)
+		sample_nodes, sequence_length, metadata=None, population_names=None,
+		compact=False, integer_coordinates=False):
+		self.left = np.asarray(left, dtype=np.float64)
+		self.right = np.asarray(right, dtype=np.float64)
+		self.population = np.asarray(population, dtype=np.int32)
+		self.ancestor = np.asarray(ancestor, dtype=np.int32)
+		self.sample = np.asarray(child, dtype=np.int32)
+		self._check_row_lengths()
+
+		# Sort the columns by sample and then by left coordinate.
+		with _stage('sort') as record:
+			if not _is_sorted(self.sample, self.left):
+				order = np.lexsort((self.left, self.sample))
+				self.left = self.left[order]
+				self.right = self.right[order]
+				self.population = self.population[order]
+				self.ancestor = self.ancestor[order]
+				self.sample = self.sample[order]
+			record['rows'] = len(self.sample)
+		with _stage('summaries'):
+			self._init_summaries(sample_nodes, sequence_length, metadata)
+		self._set_population_names(population_names)
+		if compact:
+			self._compact(integer_coordinates)
+		elif integer_coordinates:
+			raise ValueError("Integer coordinates are only available in compact storage.")
+
+	@classmethod
+	def _from_sorted_columns(cls, columns, sample_nodes, sequence_length,
+		metadata=None):
+		"""
+		Creates an object from columns that are already sorted by sample and
+		left coordinate, without checking or copying them.
+		"""
+		local_ancestry = cls.__new__(cls)
+		local_ancestry.sample = columns['sample']
+		local_ancestry.left = columns['left']
+		local_ancestry.right = columns['right']
+		local_ancestry.ancestor = columns['ancestor']
+		local_ancestry.population = columns['population']
+		local_ancestry._init_summaries(sample_nodes, sequence_length, metadata)
+		return local_ancestry
+
+	def _init_summaries(self, sample_nodes, sequence_length, metadata):
+		"""
+		Sets the summary attributes of an object whose columns are sorted.
+		"""
 		self._sequence_length = sequence_length
-		# self._num_rows = self.__num_rows()
-		
-		# Create the ancestry tables
-		self.ancestry_table = pd.DataFrame(
-		data = {
-			'left': left,
-			'right': right,
-			'ancestor' : ancestor,
-			'population' : population,
-			'sample' : child
-		})
-		self.ancestry_table.sort_values(
-			by=['sample','left'], inplace=True, ignore_index=True)
-		# Squashed table
-		self.squashed_table = self._squash_ancestry_tracts()
+		self.keys = None
+		"""The labels of the sequences combined by :meth:`tspop.concat`, if any."""
+		self.key_name = None
+		self._key_offsets = None
+		self.metadata = {} if metadata is None else dict(metadata)
+		"""A dictionary of user metadata, saved by :meth:`tspop.PopAncestry.dump`."""
+		self.compact = False
+		"""Whether the data is stored in compact form (see :ref:`compactstorage`)."""
+		# Only kept with profile=True, so that the progress function of a
+		# finished calculation is not called by later lazy builds.
+		self._profiler = None
+		if _profiler is not None and _profiler.trace_memory:
+			self._profiler = _profiler
+		self.profile = None if self._profiler is None else self._profiler.records
 		"""
-		A pandas.DataFrame object with column labels ``sample``, ``left``, ``right``, ``population``.
-		Each row (``sample``, ``left``, ``right``, ``population``) indicates that over the genomic interval
-		with coordinates [``left``, ``right``), the sample node with ID ``sample`` has inherited
-		from an ancestral node in the population with ID ``population``.
-		Population labels are taken from the specified census time.
+		If the object was made by :meth:`tspop.get_pop_ancestry` with
+		``profile=True``, a list with a dictionary recording each stage of the
+		calculation (see :ref:`profiling`). Otherwise None.
+		"""
+		self.population_names = None
+		"""The names of the populations, indexed by population ID, if known."""
+
+		# Summary attributes. Some are just wrappers for the ts attributes -- needed?
+		self.samples = sample_nodes
+		self.num_samples = len(sample_nodes)
+		"""The number of provided samples."""
+		self.total_genome_length = sequence_length * self.num_samples
+		"""Sequence length times the number of samples."""
+
+		# Tables and the remaining summaries are computed on first access.
+		self._ancestry_table = None
+		self._squashed_columns = None
+		self._squashed_table = None
+		self._ancestral_pops = None
+		self._ancestors = None
+		self._coverage = None
+		self._sample_index = None
+		self._row_index = None
+		self._ancestry_coverage = None
+		self._ancestor_coverage = None
+		self._tract_lengths = None
+		self._tract_groups = {}
+
+	def _set_population_names(self, population_names):
+		if population_names is not None:
+			population_names = list(population_names)
+			if len(set(population_names)) != len(population_names):
+				raise ValueError("Population names must be unique.")
+		self.population_names = population_names
+
+	def _compact(self, integer_coordinates=False):
+		"""
+		Converts the columns (and the squashed columns, if calculated) to
+		the narrowest dtypes that hold them.
+		"""
+		columns = _compact_columns({n: getattr(self, n) for n in _COLUMNS},
+			self._sequence_length, integer_coordinates)
+		for n, column in columns.items():
+			setattr(self, n, column)
+		if self._squashed_columns is not None:
+			self._squashed_columns = tuple(c.astype(columns[n].dtype, copy=False)
+				for c, n in zip(self._squashed_columns, ('sample', 'left', 'right', 'population')))
+		self.compact = True
+
+	def _inherit_settings(self, other):
+		"""
+		Copies the keys and storage settings of another object.
 		"""
-		# Reorder the raw table
-		self.ancestry_table = self.ancestry_table[['sample', 'left', 'right', 'ancestor', 'population']]
+		if other.keys is not None:
+			self._set_keys(other.keys, other.key_name, other._key_offsets)
+		self.compact = other.compact
+		self.population_names = other.population_names
+
+	def _set_keys(self, keys, key_name, key_offsets):
+		self.keys = list(keys)
+		self.key_name = key_name
+		self._key_offsets = np.asarray(key_offsets, dtype=np.float64)
+
+	def _key_index(self, left):
+		"""
+		Returns the index of the key of the sequence each coordinate lies in.
+		"""
+		return np.searchsorted(self._key_offsets, left, side='right') - 1
+
+	def _table_from_columns(self, columns):
+		"""
+		Returns a table with the given columns. If the object has keys,
+		a key column is added and coordinates are made relative to the start
+		of each key's sequence.
+		"""
+		import pandas as pd
+		if self.keys is not None:
+			k = self._key_index(columns['left'])
+			offset = self._key_offsets[k]
+			columns = dict(columns,
+				left=columns['left'] - offset, right=columns['right'] - offset)
+			columns = dict({self.key_name: np.asarray(self.keys)[k]},
+				**columns)
+		if self.population_names is not None:
+			columns['population'] = pd.Categorical.from_codes(
+				columns['population'], categories=self.population_names)
+		# Compact tables share memory with the columns.
+		return pd.DataFrame(columns, copy=False if self.compact else None)
+
+	@property
+	def ancestry_table(self):
 		"""
 		A pandas.DataFrame object with column labels ``sample``, ``left``, ``right``, ``ancestor``, ``population``.
 		Each row (``sample``, ``left``, ``right``, ``ancestor``, ``population``) indicates that over the genomic interval
@@ -101,22 +1228,71 @@ class PopAncestry(object):
 		from the ancestral node with ID ``ancestor`` in the population with ID ``population``.
 		Ancestral nodes and population labels are taken from the specified census time.
 		"""
+		if self._ancestry_table is None:
+			with _stage('ancestry_table', self._profiler) as record:
+				self._ancestry_table = self._table_from_columns({
+					'sample' : self.sample,
+					'left': self.left,
+					'right': self.right,
+					'ancestor' : self.ancestor,
+					'population' : self.population
+				})
+				record['rows'] = len(self.sample)
+		return self._ancestry_table
 
-		# Summary attributes. Some are just wrappers for the ts attributes -- needed?
-		self.ancestral_pops = list(set(self.squashed_table['population']))
-		self.num_ancestral_pops = len(self.ancestral_pops)
-		self.samples = sample_nodes
-		self.num_samples = len(sample_nodes)
-		"""The number of provided samples."""
-		self.ancestors = list(set(self.ancestry_table['ancestor']))
-		self.num_ancestors = len(self.ancestors)
+	@ancestry_table.setter
+	def ancestry_table(self, table):
+		self._ancestry_table = table
+
+	@property
+	def squashed_table(self):
+		"""
+		A pandas.DataFrame object with column labels ``sample``, ``left``, ``right``, ``population``.
+		Each row (``sample``, ``left``, ``right``, ``population``) indicates that over the genomic interval
+		with coordinates [``left``, ``right``), the sample node with ID ``sample`` has inherited
+		from an ancestral node in the population with ID ``population``.
+		Population labels are taken from the specified census time.
+		"""
+		if self._squashed_table is None:
+			self._squashed_table = self._squash_ancestry_tracts()
+		return self._squashed_table
+
+	@squashed_table.setter
+	def squashed_table(self, table):
+		self._squashed_table = table
+
+	@property
+	def ancestral_pops(self):
+		"""The population IDs of the ancestral populations."""
+		if self._ancestral_pops is None:
+			self._ancestral_pops = np.unique(self.population).tolist()
+		return self._ancestral_pops
+
+	@property
+	def num_ancestral_pops(self):
+		"""The number of ancestral populations."""
+		return len(self.ancestral_pops)
+
+	@property
+	def ancestors(self):
+		"""The IDs of the ancestral nodes."""
+		if self._ancestors is None:
+			self._ancestors = np.unique(self.ancestor).tolist()
+		return self._ancestors
+
+	@property
+	def num_ancestors(self):
 		"""The number of ancestral haplotypes. Strictly less than or equal to the
 		number of inputted ancestral nodes."""
-		self.total_genome_length = sequence_length * self.num_samples
-		"""Sequence length times the number of samples."""
-		self.coverage = self._calculate_coverage()
+		return len(self.ancestors)
+
+	@property
+	def coverage(self):
 		"""The proportion of the total genome length with an ancestor in the
 		:attr:`tspop.PopAncestry.squashed_table` and :attr:`tspop.PopAncestry.ancestry_table`."""
+		if self._coverage is None:
+			self._coverage = self._calculate_coverage()
+		return self._coverage
 
 	def __str__(self):
 		ret = """\nPopAncestry summary\n"""
@@ -127,20 +1303,34 @@ class PopAncestry(object):
 		ret += "Ancestral coverage: \t\t\t{:.6f}\n".format(self.coverage)
 		return ret[:-1]
 
-	# def __num_rows(self):
-	# 	"""
-	# 	Returns the number of rows in the table.
-	# 	"""
-	# 	self._check_row_lengths()
-	# 	return len(self.left)
-
 	def _check_row_lengths(self):
 		"""
 		Checks that the length of each input field is the same.
 		"""
-		assert len(self.left) == len(self.right)
-		assert len(self.right) == len(self.population)
-		assert len(self.population) == len(self.sample)
+		num_rows = len(self.left)
+		for column in (self.right, self.population, self.ancestor, self.sample):
+			if len(column) != num_rows:
+				raise ValueError("All input columns must have the same length.")
+
+	def _get_squashed_columns(self):
+		"""
+		Returns the ``sample``, ``left``, ``right`` and ``population`` arrays
+		of the squashed table.
+		"""
+		if self._squashed_columns is None:
+			with _stage('squash_tracts', self._profiler) as record:
+				keys = [self.sample, self.population]
+				if self.keys is not None:
+					keys.append(self._key_index(self.left))
+				starts, ends = _find_runs(self.left, self.right, *keys)
+				self._squashed_columns = (
+					self.sample[starts],
+					self.left[starts],
+					self.right[ends],
+					self.population[starts]
+				)
+				record['rows'] = len(starts)
+		return self._squashed_columns
 
 	def _squash_ancestry_tracts(self):
 		"""
@@ -148,32 +1338,111 @@ class PopAncestry(object):
 		(population labels are removed and only contiguous segments
 		from the same population are shown.)
 		"""
-		new_sample = []
-		new_left = []
-		new_right = []
-		new_population = []
-
-		for ind, row in self.ancestry_table.iterrows():
-			if ind > 0 and row['left']==new_right[-1] and row['population'] == new_population[-1] and row['sample'] == new_sample[-1]:
-				new_right[-1] = row['right']
-			else:
-				new_sample.append(row['sample'])
-				new_left.append(row['left'])
-				new_right.append(row['right'])
-				new_population.append(row['population'])
-				
-		squashed_ancestry_table = pd.DataFrame({
-			'sample': [int(i) for i in new_sample],
-			'left' : new_left,
-			'right': new_right,
-			'population' : [int(p) for p in new_population]
-		})
+		sample, left, right, population = self._get_squashed_columns()
+		with _stage('squashed_table', self._profiler) as record:
+			if not self.compact:
+				sample = sample.astype(np.int64)
+				population = population.astype(np.int64)
+			squashed_ancestry_table = self._table_from_columns({
+				'sample': sample,
+				'left' : left,
+				'right': right,
+				'population' : population
+			})
+			record['rows'] = len(sample)
 
 		return(squashed_ancestry_table)
 
 	def _calculate_coverage(self):
-		lengths = self.squashed_table['right'] - self.squashed_table['left']
-		return np.sum(lengths)
+		return np.sum(self.right - self.left)
+
+	def _get_ancestor_coverage(self):
+		"""
+		Returns the ancestor IDs and their populations, the IDs of the samples
+		in the output, and the nonzero entries of the matrix holding the length
+		of sequence each sample inherits from each ancestor, as the row index,
+		column index and value of each entry.
+		"""
+		if self._ancestor_coverage is None:
+			# The rank of each row's ancestor among the ancestor IDs.
+			offset = self.ancestor.min() if len(self.ancestor) > 0 else 0
+			counts = np.bincount(self.ancestor - offset)
+			ancestors = (np.flatnonzero(counts) + offset).astype(self.ancestor.dtype)
+			rank = (np.cumsum(counts > 0) - 1)[self.ancestor - offset]
+			population = np.zeros(len(ancestors), dtype=self.population.dtype)
+			population[rank] = self.population
+			sample_ids, offsets = _sample_offsets(self.sample)
+			sample_index = np.repeat(np.arange(len(sample_ids)), np.diff(offsets))
+			# The rows are sorted by sample, so a stable sort by ancestor
+			# sorts them by ancestor and then by sample. Small keys are
+			# sorted with numpy's much faster radix sort.
+			if len(ancestors) <= np.iinfo(np.uint16).max + 1:
+				rank = rank.astype(np.uint16)
+			order = np.argsort(rank, kind='stable')
+			rank = rank[order]
+			sample_index = sample_index[order]
+			breaks = np.ones(len(order), dtype=bool)
+			breaks[1:] = (rank[1:] != rank[:-1]) | (sample_index[1:] != sample_index[:-1])
+			starts = np.flatnonzero(breaks)
+			length = np.zeros(len(starts))
+			if len(starts) > 0:
+				length = np.add.reduceat((self.right - self.left)[order], starts)
+			self._ancestor_coverage = (ancestors, population, sample_ids,
+				rank[starts].astype(np.int64), sample_index[starts], length)
+		return self._ancestor_coverage
+
+	def ancestor_summary(self):
+		"""
+		Summarises how the census ancestors are shared across samples.
+
+		:returns: a pandas.DataFrame indexed by ancestor ID, with columns
+			``population`` (the population of the ancestor), ``num_samples``
+			(the number of samples that inherit from the ancestor) and
+			``length`` (the total length of sequence inherited from the
+			ancestor, summed over samples).
+		"""
+		import pandas as pd
+		ancestors, population, _, rows, _, length = self._get_ancestor_coverage()
+		return pd.DataFrame({
+			'population': population.astype(np.int64),
+			'num_samples': np.bincount(rows, minlength=len(ancestors)),
+			'length': np.bincount(rows, weights=length, minlength=len(ancestors))
+			}, index=pd.Index(ancestors.astype(np.int64), name='ancestor'))
+
+	def ancestor_coverage(self):
+		"""
+		Returns the length of sequence each sample inherits from each census
+		ancestor, for every pair with a nonzero length.
+
+		:returns: a pandas.DataFrame with columns ``ancestor``, ``sample``
+			and ``length``, sorted by ancestor and then by sample.
+		"""
+		import pandas as pd
+		ancestors, _, sample_ids, rows, cols, length = self._get_ancestor_coverage()
+		return pd.DataFrame({
+			'ancestor': ancestors[rows].astype(np.int64),
+			'sample': sample_ids[cols].astype(np.int64),
+			'length': length
+			})
+
+	def ancestor_coverage_matrix(self):
+		"""
+		Returns a sparse matrix holding the length of sequence each sample
+		inherits from each census ancestor. Requires scipy.
+
+		:returns: a tuple of a scipy.sparse.csr_matrix with one row per
+			ancestor and one column per sample, the ancestor IDs of the rows,
+			and the sample IDs of the columns.
+		"""
+		try:
+			import scipy.sparse
+		except ImportError:
+			raise ImportError("The ancestor coverage matrix requires scipy. "
+				"Use ancestor_coverage for the nonzero entries instead.")
+		ancestors, _, sample_ids, rows, cols, length = self._get_ancestor_coverage()
+		matrix = scipy.sparse.csr_matrix((length, (rows, cols)),
+			shape=(len(ancestors), len(sample_ids)))
+		return matrix, ancestors, sample_ids
 
 	def calculate_ancestry_fraction(self, population, sample=None):
 		"""
@@ -186,49 +1455,473 @@ class PopAncestry(object):
 		:type sample: int
 		:returns: the global ancestry fraction.
 		"""
+		sample_ids, pops, coverage = self._get_ancestry_coverage()
 		# Subset by population.
-		if (population not in np.unique(self.squashed_table['population'])):
+		if population not in self.ancestral_pops:
 			raise ValueError("There are no populations with this label in the output.")
-		df = self.squashed_table[self.squashed_table.population == population]
-		
+		col = coverage[:, pops.index(population)]
+
 		# Subset by sample node.
 		if sample is not None:
-			if sample not in np.unique(self.squashed_table['sample']):
+			i = np.searchsorted(sample_ids, sample)
+			if i == len(sample_ids) or sample_ids[i] != sample:
 				raise ValueError("This sample node does not appear in the output.")
-			df = df[df['sample'] == sample]
+			return col[i] / self._sequence_length
 
-		# Calculate global ancestry fractions.
-		total_coverage = np.sum(df['right'] - df['left'])
-		total_length = len(np.unique(df['sample'])) * self._sequence_length
+		# Calculate global ancestry fractions over the samples that
+		# inherit from this population.
+		total_coverage = np.sum(col)
+		total_length = np.count_nonzero(col) * self._sequence_length
 		
 		return total_coverage/total_length
+
+	def _get_ancestry_coverage(self):
+		"""
+		Returns the sample IDs in the output, the population IDs, and a
+		matrix holding the length of sequence each sample inherits from each
+		population.
+		"""
+		if self._ancestry_coverage is None:
+			sample_ids, offsets = _sample_offsets(self.sample)
+			sample_index = np.repeat(
+				np.arange(len(sample_ids)), np.diff(offsets))
+			pops = self.ancestral_pops
+			pop_index = np.searchsorted(pops, self.population)
+			coverage = np.bincount(
+				sample_index * len(pops) + pop_index,
+				weights=self.right - self.left,
+				minlength=len(sample_ids) * len(pops)
+				).reshape(len(sample_ids), len(pops))
+			self._ancestry_coverage = (sample_ids, pops, coverage)
+		return self._ancestry_coverage
+
+	def calculate_ancestry_fractions(self, ts=None):
+		"""
+		Returns the fraction of genomic material that each sample has
+		inherited from each ancestral population.
+
+		:param ts: If given, the sample nodes are grouped into the individuals
+			of this tree sequence (e.g. the two chromosomes of a diploid),
+			and fractions are given per individual.
+		:type ts: tskit.TreeSequence
+		:returns: a pandas.DataFrame with one row per sample (or individual)
+			and one column per population.
+		"""
+		import pandas as pd
+		sample_ids, pops, coverage = self._get_ancestry_coverage()
+		if ts is None:
+			index = pd.Index(sample_ids.astype(np.int64), name='sample')
+			fractions = coverage / self._sequence_length
+		else:
+			individual = _table_column(ts, 'nodes', 'individual')[sample_ids]
+			if np.any(individual == tskit.NULL):
+				raise ValueError("Every sample node must belong to an individual.")
+			ind_ids, ind_index = np.unique(individual, return_inverse=True)
+			ind_coverage = np.zeros((len(ind_ids), len(pops)))
+			np.add.at(ind_coverage, ind_index, coverage)
+			ploidy = np.bincount(ind_index, minlength=len(ind_ids))
+			index = pd.Index(ind_ids.astype(np.int64), name='individual')
+			fractions = ind_coverage / (ploidy[:, np.newaxis] * self._sequence_length)
+		return pd.DataFrame(fractions, index=index,
+			columns=pd.Index(pops, name='population'))
 	
+	def _get_sample_index(self, squashed=True):
+		"""
+		Returns the sample IDs in the squashed table (or the ancestry table)
+		and the offsets of their rows (see :func:`_sample_offsets`).
+		"""
+		if squashed:
+			if self._sample_index is None:
+				self._sample_index = _sample_offsets(self._get_squashed_columns()[0])
+			return self._sample_index
+		if self._row_index is None:
+			self._row_index = _sample_offsets(self.sample)
+		return self._row_index
+
+	def _sample_rows(self, samples, squashed=True):
+		"""
+		Returns the start and end offsets of the squashed rows (or ancestry
+		table rows) of each given sample. Samples with no rows get an empty range.
+		"""
+		ids, offsets = self._get_sample_index(squashed)
+		samples = np.asarray(samples)
+		i = np.searchsorted(ids, samples)
+		found = i < len(ids)
+		found[found] = ids[i[found]] == samples[found]
+		starts = np.where(found, offsets[np.minimum(i, len(ids))], 0)
+		ends = np.where(found, offsets[np.minimum(i + 1, len(ids))], 0)
+		return starts, ends
+
+	def local_ancestry_at(self, positions, samples=None):
+		"""
+		Returns the population that each sample has inherited from at each of
+		the given genomic positions.
+
+		The positions need not be sorted; see
+		:meth:`tspop.PopAncestry.local_ancestry_matrix`, which this calls
+		with ``dtype=np.int32``.
+
+		:param positions: The genomic positions to query.
+		:type positions: list(float)
+		:param samples: The sample nodes to query. If None, defaults to all
+			samples.
+		:type samples: list(int)
+		:returns: a numpy array of population IDs with one row per sample
+			and one column per position. Positions that are not covered by a
+			tract are labelled -1.
+		"""
+		positions = np.asarray(positions, dtype=np.float64)
+		order = np.argsort(positions, kind='stable')
+		out = self.local_ancestry_matrix(positions[order], samples, dtype=np.int32)
+		if np.any(order != np.arange(len(order))):
+			out[:, order] = out.copy()
+		return out
+
+	def _position_ranges(self, positions, samples):
+		"""
+		Returns the index of the sample, the range of covered positions and
+		the population of each squashed tract of the given samples.
+		"""
+		_, left, right, population = self._get_squashed_columns()
+		starts, ends = self._sample_rows(samples)
+		rows = _ranges_to_rows(starts, ends)
+		sample_index = np.repeat(np.arange(len(starts)), ends - starts)
+		lo = np.searchsorted(positions, left[rows], side='left')
+		hi = np.searchsorted(positions, right[rows], side='left')
+		return sample_index, lo, hi, population[rows]
+
+	def local_ancestry_matrix(self, positions, samples=None, outfile=None,
+		dtype=np.uint8, block_size=None):
+		"""
+		Returns a matrix of the population that each sample has inherited from
+		at each of the given genomic positions, such as the sites of a tree
+		sequence. The matrix is filled a block of samples at a time; if
+		``outfile`` is given, each block is written to a memory-mapped
+		``.npy`` file, so the matrix may be larger than the available memory.
+
+		:param positions: The sorted genomic positions to query, or a
+			tskit.TreeSequence whose site positions are used.
+		:type positions: list(float)
+		:param samples: The sample nodes to query. If None, defaults to all
+			samples.
+		:type samples: list(int)
+		:param outfile: The path of a ``.npy`` file to write the matrix to.
+			If None, the matrix is held in memory.
+		:type outfile: str
+		:param dtype: The integer dtype of the matrix. Defaults to uint8.
+		:param block_size: The number of samples filled at a time. If None,
+			blocks of around 16 million entries are used.
+		:type block_size: int
+		:returns: a numpy array (or a numpy.memmap, if ``outfile`` is given)
+			of population IDs with one row per sample and one column per
+			position. Positions that are not covered by a tract hold -1 for
+			signed dtypes and the largest value of the dtype (255 for uint8)
+			for unsigned dtypes.
+		"""
+		positions = _check_positions(positions, self._sequence_length)
+		samples = np.asarray(self.samples if samples is None else samples)
+		dtype = np.dtype(dtype)
+		missing = np.iinfo(dtype).max if dtype.kind == 'u' else -1
+		if len(self.population) > 0 and self.population.max() >= np.iinfo(dtype).max:
+			raise ValueError("The dtype is too narrow to hold the population IDs.")
+		shape = (len(samples), len(positions))
+		if outfile is None:
+			out = np.empty(shape, dtype=dtype)
+		else:
+			out = np.lib.format.open_memmap(outfile, mode='w+', dtype=dtype, shape=shape)
+		if block_size is None:
+			block_size = max(1, _MATRIX_BLOCK_CELLS // max(len(positions), 1))
+		for b in range(0, len(samples), block_size):
+			block = out[b:b + block_size]
+			block.reshape(-1)[:] = _fill_values(block.size, len(positions),
+				*self._position_ranges(positions, samples[b:b + block_size]),
+				missing, dtype)
+		if outfile is not None:
+			out.flush()
+		return out
+
+	def local_ancestry_runs(self, positions, samples=None):
+		"""
+		Returns a run-length representation of the local ancestry matrix
+		given by :meth:`tspop.PopAncestry.local_ancestry_matrix`. Each row
+		gives a run of consecutive positions at which a sample has inherited
+		from the same population. Positions that are not covered by a run
+		are not covered by a tract.
+
+		:param positions: The sorted genomic positions to query, or a
+			tskit.TreeSequence whose site positions are used.
+		:type positions: list(float)
+		:param samples: The sample nodes to query. If None, defaults to all
+			samples.
+		:type samples: list(int)
+		:returns: a pandas.DataFrame with columns ``sample``, ``start``,
+			``end`` and ``population``, where ``start`` and ``end`` are the
+			indexes of the first position in the run and of the position
+			after the last.
+		"""
+		import pandas as pd
+		positions = _check_positions(positions, self._sequence_length)
+		samples = np.asarray(self.samples if samples is None else samples)
+		sample_index, lo, hi, population = self._position_ranges(positions, samples)
+		keep = hi > lo
+		return pd.DataFrame({
+			'sample': samples[sample_index[keep]].astype(np.int64),
+			'start': lo[keep],
+			'end': hi[keep],
+			'population': population[keep].astype(np.int64)
+			})
+
+	def tracts_overlapping(self, left, right, samples=None):
+		"""
+		Returns the rows of the :attr:`tspop.PopAncestry.squashed_table`
+		whose tracts overlap the genomic interval [``left``, ``right``).
+		If the object has keys, the interval is given in the coordinates
+		of the combined sequence (see :meth:`tspop.concat`).
+
+		:param left: The left coordinate of the interval.
+		:type left: float
+		:param right: The right coordinate of the interval.
+		:type right: float
+		:param samples: The sample nodes to query. If None, defaults to all
+			samples.
+		:type samples: list(int)
+		:returns: a pandas.DataFrame with the same columns as the
+			:attr:`tspop.PopAncestry.squashed_table`.
+		"""
+		if samples is None:
+			samples = self.samples
+		rows = _ranges_to_rows(*self._sample_rows(np.unique(samples)))
+		sample, tract_left, tract_right, population = (
+			c[rows] for c in self._get_squashed_columns())
+		overlaps = (tract_right > left) & (tract_left < right)
+		sample, population = sample[overlaps], population[overlaps]
+		if not self.compact:
+			sample = sample.astype(np.int64)
+			population = population.astype(np.int64)
+		return self._table_from_columns({
+			'sample': sample,
+			'left': tract_left[overlaps],
+			'right': tract_right[overlaps],
+			'population': population
+		})
+
+	def tract_lengths(self, rate_map=None):
+		"""
+		Returns the lengths of the tracts in the :attr:`tspop.PopAncestry.squashed_table`.
+
+		:param rate_map: If given, lengths are converted to genetic map units
+			(centiMorgans) using this recombination map.
+		:type rate_map: msprime.RateMap
+		:returns: a numpy array of tract lengths, in the order of the rows of the
+			squashed table.
+		"""
+		if self._tract_lengths is None or self._tract_lengths[0] is not rate_map:
+			_, left, right, _ = self._get_squashed_columns()
+			if rate_map is None:
+				lengths = right - left
+			else:
+				lengths = 100 * (rate_map.get_cumulative_mass(right)
+					- rate_map.get_cumulative_mass(left))
+			self._tract_lengths = (rate_map, lengths)
+		return self._tract_lengths[1]
+
+	def _get_tract_groups(self, by):
+		"""
+		Returns the group of each squashed tract and a pandas.Index of the
+		groups, where ``by`` is 'population', 'sample' or ['sample', 'population'].
+		"""
+		import pandas as pd
+		by = tuple([by] if isinstance(by, str) else by)
+		if by not in self._tract_groups:
+			sample, _, _, population = self._get_squashed_columns()
+			columns = {'sample': sample, 'population': population}
+			if len(by) == 0 or any(b not in columns for b in by):
+				raise ValueError("Tracts can only be grouped by 'population' and/or 'sample'.")
+			ids, codes = zip(*[np.unique(columns[b], return_inverse=True) for b in by])
+			group = np.ravel_multi_index(codes, [len(i) for i in ids]) if len(by) > 1 else codes[0]
+			present, group = np.unique(group, return_inverse=True)
+			if len(by) == 1:
+				index = pd.Index(ids[0][present].astype(np.int64), name=by[0])
+			else:
+				levels = np.unravel_index(present, [len(i) for i in ids])
+				index = pd.MultiIndex.from_arrays(
+					[i[l].astype(np.int64) for i, l in zip(ids, levels)], names=by)
+			self._tract_groups[by] = (group, index)
+		return self._tract_groups[by]
+
+	def tract_length_histogram(self, bins, by='population', rate_map=None):
+		"""
+		Returns histograms of tract lengths per population and/or sample.
+
+		:param bins: The increasing edges of the histogram bins. As in
+			``numpy.histogram``, every bin but the last is half-open and
+			lengths outside the bins are not counted.
+		:type bins: list(float)
+		:param by: 'population', 'sample', or ['sample', 'population'].
+		:type by: str or list(str)
+		:param rate_map: If given, lengths are measured in centiMorgans
+			(see :meth:`tspop.PopAncestry.tract_lengths`).
+		:type rate_map: msprime.RateMap
+		:returns: a pandas.DataFrame of counts with one row per group and one
+			column per bin.
+		"""
+		import pandas as pd
+		bins = np.asarray(bins, dtype=np.float64)
+		if len(bins) < 2 or np.any(np.diff(bins) <= 0):
+			raise ValueError("Bins must be increasing with at least two edges.")
+		lengths = self.tract_lengths(rate_map)
+		group, index = self._get_tract_groups(by)
+		num_bins = len(bins) - 1
+		b = np.searchsorted(bins, lengths, side='right') - 1
+		b[lengths == bins[-1]] = num_bins - 1
+		keep = (b >= 0) & (b < num_bins)
+		counts = np.bincount(group[keep] * num_bins + b[keep],
+			minlength=len(index) * num_bins).reshape(len(index), num_bins)
+		return pd.DataFrame(counts, index=index,
+			columns=pd.IntervalIndex.from_breaks(bins, closed='left'))
+
+	def mean_tract_length(self, by='population', rate_map=None):
+		"""
+		Returns the mean tract length per population and/or sample.
+
+		:param by: 'population', 'sample', or ['sample', 'population'].
+		:type by: str or list(str)
+		:param rate_map: If given, lengths are measured in centiMorgans
+			(see :meth:`tspop.PopAncestry.tract_lengths`).
+		:type rate_map: msprime.RateMap
+		:returns: a pandas.Series of mean lengths with one entry per group.
+		"""
+		import pandas as pd
+		lengths = self.tract_lengths(rate_map)
+		group, index = self._get_tract_groups(by)
+		totals = np.bincount(group, weights=lengths, minlength=len(index))
+		counts = np.bincount(group, minlength=len(index))
+		return pd.Series(totals / counts, index=index, name='mean_length')
+
+	def tract_length_quantiles(self, q, by='population', rate_map=None):
+		"""
+		Returns quantiles of the tract lengths per population and/or sample,
+		using linear interpolation as in ``numpy.quantile``.
+
+		:param q: The quantiles to compute, between 0 and 1.
+		:type q: list(float)
+		:param by: 'population', 'sample', or ['sample', 'population'].
+		:type by: str or list(str)
+		:param rate_map: If given, lengths are measured in centiMorgans
+			(see :meth:`tspop.PopAncestry.tract_lengths`).
+		:type rate_map: msprime.RateMap
+		:returns: a pandas.DataFrame with one row per group and one column per quantile.
+		"""
+		import pandas as pd
+		q = np.atleast_1d(np.asarray(q, dtype=np.float64))
+		if np.any(q < 0) or np.any(q > 1):
+			raise ValueError("Quantiles must be between 0 and 1.")
+		lengths = self.tract_lengths(rate_map)
+		group, index = self._get_tract_groups(by)
+		# Sort the lengths within each group, then interpolate between the
+		# order statistics of every group at once.
+		order = np.lexsort((lengths, group))
+		sorted_lengths = lengths[order]
+		counts = np.bincount(group, minlength=len(index))
+		offsets = np.append(0, np.cumsum(counts)[:-1])
+		position = offsets[:, np.newaxis] + q * (counts[:, np.newaxis] - 1)
+		lower = np.floor(position).astype(np.int64)
+		upper = np.minimum(lower + 1, (offsets + counts - 1)[:, np.newaxis])
+		fraction = position - lower
+		values = (sorted_lengths[lower] * (1 - fraction)
+			+ sorted_lengths[upper] * fraction)
+		return pd.DataFrame(values, index=index, columns=pd.Index(q, name='quantile'))
+
+	def windowed_ancestry(self, windows, by_sample=False):
+		"""
+		Returns the proportion of sequence inherited from each ancestral
+		population in each genomic window.
+
+		:param windows: Increasing breakpoints of the genomic windows, starting
+			at 0 and ending at the sequence length.
+		:type windows: list(float)
+		:param by_sample: If True, proportions are given separately for each
+			sample in :attr:`tspop.PopAncestry.samples`. Otherwise they are
+			averaged over all samples.
+		:type by_sample: bool
+		:returns: a numpy array with one row per window and one column per
+			population in :attr:`tspop.PopAncestry.ancestral_pops`, and a third
+			dimension for samples if ``by_sample`` is True.
+		"""
+		windows = _check_windows(windows, self._sequence_length)
+		window_lengths = np.diff(windows)
+		pops = self.ancestral_pops
+		_, left, right, population = self._get_squashed_columns()
+		if not by_sample:
+			out = np.zeros((len(window_lengths), len(pops)))
+			for j, pop in enumerate(pops):
+				keep = population == pop
+				covered = _covered_length(left[keep], right[keep], windows)
+				out[:, j] = np.diff(covered)
+			return out / (window_lengths[:, np.newaxis] * self.num_samples)
+
+		out = np.zeros((len(window_lengths), len(pops), self.num_samples))
+		pop_index = np.searchsorted(pops, population)
+		starts, ends = self._sample_rows(self.samples)
+		for i, (a, b) in enumerate(zip(starts, ends)):
+			if a == b:
+				continue
+			# Cumulative length from each population over the sample's tracts,
+			# corrected for the part of a tract that extends past each breakpoint.
+			lengths = np.zeros((b - a + 1, len(pops)))
+			lengths[np.arange(1, b - a + 1), pop_index[a:b]] = right[a:b] - left[a:b]
+			lengths = np.cumsum(lengths, axis=0)
+			k = np.searchsorted(left[a:b], windows, side='right')
+			covered = lengths[k]
+			last = a + np.maximum(k - 1, 0)
+			excess = np.where(k > 0, np.maximum(right[last] - windows, 0), 0)
+			covered[np.arange(len(windows)), pop_index[last]] -= excess
+			out[:, :, i] = np.diff(covered, axis=0)
+		return out / window_lengths[:, np.newaxis, np.newaxis]
+
+	def subset(self, subset_samples):
+		"""
+		Returns a new :class:`tspop.PopAncestry` object holding only the
+		given samples. The rows of each sample are stored contiguously, so this
+		takes time proportional to the number of selected rows, and if the
+		selected rows are contiguous the new object shares this object's data.
+
+		:param subset_samples: The sample nodes to keep.
+		:type subset_samples: list(int)
+		:returns: a :class:`tspop.PopAncestry` object
+		"""
+		subset_samples = np.unique(np.asarray(subset_samples, dtype=np.int32))
+		rows = _ranges_to_rows(*self._sample_rows(subset_samples, squashed=False))
+		squashed_rows = _ranges_to_rows(*self._sample_rows(subset_samples))
+		samples = np.asarray(self.samples)
+		local_ancestry = PopAncestry._from_sorted_columns(
+			{n: getattr(self, n)[rows] for n in _COLUMNS},
+			samples[np.isin(samples, subset_samples)],
+			self._sequence_length, self.metadata)
+		local_ancestry._inherit_settings(self)
+		local_ancestry._squashed_columns = tuple(
+			c[squashed_rows] for c in self._get_squashed_columns())
+		return local_ancestry
+
 	def subset_tables(self, subset_samples, inplace=False):
 		"""
 		Subsets the ancestry table and squashed table by sample.
 		Note: by default this returns a copy of the original tables.
 		To overwrite the original tables, set inplace=True.
-		(In this case, the function returns nothing).
+		(In this case, the function returns nothing, and the samples and
+		summaries of this object are updated to match the new tables).
 
 		:param subset_samples: The sample nodes to keep.
 		:type subset_samples: list(int)
 		:param inplace: Whether to overwrite the original tables.
 		:type inplace: bool
-		:returns: The subsetted ancestry table and squashed table (only if `inplace=True`).
+		:returns: The subsetted ancestry table and squashed table (only if `inplace=False`).
 		"""
-
-		# Subset the ancestry table.
-		ancestry_table = self.ancestry_table.loc[self.ancestry_table['sample'].isin(subset_samples)]
-
-		# Subset the squashed table.
-		squashed_table = self.squashed_table.loc[self.squashed_table['sample'].isin(subset_samples)]
-		
+		local_ancestry = self.subset(subset_samples)
 		if inplace:
-			self.squashed_table = squashed_table
-
-		if not inplace:
-			self.ancestry_table = ancestry_table
-			return ancestry_table, squashed_table
+			self.__dict__.update(local_ancestry.__dict__)
+		else:
+			return local_ancestry.ancestry_table, local_ancestry.squashed_table
 	
 	def ancestry_table_write_csv(self, outfile, **kwargs):
 		"""
@@ -250,25 +1943,221 @@ class PopAncestry(object):
 		"""
 		self.squashed_table.to_csv(outfile, **kwargs)
 
+	def _population_labels(self):
+		pops = self.ancestral_pops
+		if self.population_names is None:
+			return pops, [f'pop{p}' for p in pops]
+		return pops, [self.population_names[p] for p in pops]
+
+	def write_msp(self, output, positions, chrom='1', rate_map=None,
+		sample_names=None, compression=None, chunk_size=None):
+		"""
+		Writes the local ancestry of each sample at the given positions in
+		the ``.msp.tsv`` format of RFMix. Each row is a run of consecutive
+		positions at which no sample changes ancestry. The positions are
+		processed in chunks, so only one chunk of the local ancestry matrix
+		is held in memory.
+
+		:param output: The path of the output file, or a file object.
+		:param positions: The sorted genomic positions, or a
+			tskit.TreeSequence whose site positions are used.
+		:type positions: list(float)
+		:param chrom: The chromosome name.
+		:type chrom: str
+		:param rate_map: If given, used to write genetic positions in
+			centiMorgans. Otherwise these columns are NaN.
+		:type rate_map: msprime.RateMap
+		:param sample_names: The name of the column of each sample.
+			Defaults to the sample node IDs.
+		:type sample_names: list(str)
+		:param compression: None, 'gzip', or 'bgzip' (which requires pysam).
+		:type compression: str
+		:param chunk_size: The number of positions processed at a time.
+		:type chunk_size: int
+		"""
+		import pandas as pd
+		positions = _check_positions(positions, self._sequence_length)
+		if sample_names is None:
+			sample_names = [str(s) for s in self.samples]
+		pops, labels = self._population_labels()
+		with _open_output(output, compression) as f:
+			f.write('#Subpopulation order/codes: ' + '\t'.join(
+				f'{name}={p}' for p, name in zip(pops, labels)) + '\n')
+			f.write('\t'.join(['#chm', 'spos', 'epos', 'sgpos', 'egpos', 'n snps']
+				+ list(sample_names)) + '\n')
+			# The run that continues into the next chunk.
+			run_start, run_values = None, None
+			chunks = _position_chunks(len(positions), len(self.samples), chunk_size)
+			for k, chunk in enumerate(chunks):
+				m = self.local_ancestry_matrix(positions[chunk], dtype=np.int32)
+				new = np.flatnonzero(np.any(m[:, 1:] != m[:, :-1], axis=0)) + 1
+				if run_values is None or np.any(m[:, 0] != run_values):
+					new = np.concatenate([[0], new])
+				values = [m[:, j] for j in new]
+				starts = new + chunk.start
+				if run_start is not None:
+					values = [run_values] + values
+					starts = np.concatenate([[run_start], starts])
+				ends = np.append(starts[1:], chunk.stop)
+				if k < len(chunks) - 1:
+					run_start, run_values = starts[-1], values.pop()
+					starts, ends = starts[:-1], ends[:-1]
+				if len(starts) == 0:
+					continue
+				meta = pd.DataFrame({
+					'chm': chrom,
+					'spos': positions[starts],
+					'epos': positions[ends - 1],
+					'sgpos': _genetic_positions(positions[starts], rate_map),
+					'egpos': _genetic_positions(positions[ends - 1], rate_map),
+					'n snps': ends - starts})
+				f.write(pd.concat([meta, pd.DataFrame(np.array(values))], axis=1).to_csv(
+					sep='\t', header=False, index=False))
+
+	def write_fb(self, output, positions, chrom='1', rate_map=None,
+		sample_names=None, compression=None, chunk_size=None):
+		"""
+		Writes the local ancestry of each sample at the given positions in
+		the ``.fb.tsv`` format of RFMix, with a probability of 1 for the
+		population each sample has inherited from and 0 for the others.
+		The positions are processed in chunks, so only one chunk of the local
+		ancestry matrix is held in memory.
+
+		:param output: The path of the output file, or a file object.
+		:param positions: The sorted genomic positions, or a
+			tskit.TreeSequence whose site positions are used.
+		:type positions: list(float)
+		:param chrom: The chromosome name.
+		:type chrom: str
+		:param rate_map: If given, used to write genetic positions in
+			centiMorgans. Otherwise these columns are NaN.
+		:type rate_map: msprime.RateMap
+		:param sample_names: The name of each sample, used in the column
+			names. Defaults to the sample node IDs.
+		:type sample_names: list(str)
+		:param compression: None, 'gzip', or 'bgzip' (which requires pysam).
+		:type compression: str
+		:param chunk_size: The number of positions processed at a time.
+		:type chunk_size: int
+		"""
+		import pandas as pd
+		positions = _check_positions(positions, self._sequence_length)
+		if sample_names is None:
+			sample_names = [str(s) for s in self.samples]
+		pops, labels = self._population_labels()
+		with _open_output(output, compression) as f:
+			f.write('#reference_panel_population:\t' + '\t'.join(labels) + '\n')
+			f.write('\t'.join(['chromosome', 'physical_position', 'genetic_position',
+				'genetic_marker_index'] + [f'{name}:::{label}'
+				for name in sample_names for label in labels]) + '\n')
+			for chunk in _position_chunks(len(positions),
+				len(self.samples) * len(pops), chunk_size):
+				m = self.local_ancestry_matrix(positions[chunk], dtype=np.int32)
+				# One column for each sample and population, written as
+				# single characters.
+				probs = (m.T[:, :, None] == np.asarray(pops)).reshape(m.shape[1], -1)
+				text = np.full((probs.shape[0], 2 * probs.shape[1]), ord('\t'), dtype=np.uint8)
+				text[:, 0::2] = probs + ord('0')
+				text[:, -1] = ord('\n')
+				meta = pd.DataFrame({
+					'chromosome': chrom,
+					'physical_position': positions[chunk],
+					'genetic_position': _genetic_positions(positions[chunk], rate_map),
+					'genetic_marker_index': np.arange(chunk.start, chunk.stop)})
+				meta = meta.to_csv(sep='\t', header=False, index=False).splitlines()
+				f.write(''.join(a + '\t' + b for a, b in zip(meta,
+					text.tobytes().decode().splitlines(keepends=True))))
+
+	def write_vcf(self, ts, output, compression=None, chunk_size=1000, **kwargs):
+		"""
+		Writes the genotypes of a tree sequence to a VCF with
+		``ts.write_vcf``, adding an ``ANC`` FORMAT field that gives the
+		population each haplotype has inherited from at each site, or ``.``
+		if it is not covered by a tract. The records are annotated
+		``chunk_size`` at a time as they are written.
+
+		:param tskit.TreeSequence ts: The tree sequence this object was
+			calculated from.
+		:param output: The path of the output file, or a file object.
+		:param compression: None, 'gzip', or 'bgzip' (which requires pysam).
+		:type compression: str
+		:param chunk_size: The number of records annotated at a time.
+		:type chunk_size: int
+		:param kwargs: other keyword arguments for ``ts.write_vcf``.
+		"""
+		nodes, ploidies = _vcf_haplotypes(ts, individuals=kwargs.get('individuals'),
+			ploidy=kwargs.get('ploidy'),
+			include_non_sample_nodes=kwargs.get('include_non_sample_nodes', False))
+		positions = _table_column(ts, 'sites', 'position')
+		with _open_output(output, compression) as f:
+			writer = _VcfAncestryWriter(f, self, positions, nodes, ploidies, chunk_size)
+			ts.write_vcf(writer, **kwargs)
+			writer.flush()
+
+	def merge(self, other):
+		"""
+		Combines this object with another describing the same sequence.
+		See :meth:`tspop.concat`.
+
+		:param other: The object to combine with this one.
+		:type other: tspop.PopAncestry
+		:returns: a :class:`tspop.PopAncestry` object
+		"""
+		return concat([self, other])
+
+	def dump(self, path):
+		"""
+		Saves the object to a directory, with each column stored as a
+		separate binary ``.npy`` file. Use :meth:`tspop.load` to read it back.
+
+		:param path: The name of the output directory. It is created if it
+			does not exist, and existing files are overwritten.
+		:type path: str
+		"""
+		os.makedirs(path, exist_ok=True)
+		squashed = self._get_squashed_columns()
+		columns = {
+			'sample': self.sample,
+			'left': self.left,
+			'right': self.right,
+			'ancestor': self.ancestor,
+			'population': self.population,
+			'samples': np.asarray(self.samples, dtype=np.int32),
+			'squashed_sample': squashed[0],
+			'squashed_left': squashed[1],
+			'squashed_right': squashed[2],
+			'squashed_population': squashed[3]
+		}
+		# Each column is written to a temporary file and then moved into place,
+		# so that the columns of an object loaded from this directory are
+		# not overwritten while they are still being read.
+		for name, column in columns.items():
+			filename = os.path.join(path, name + '.npy')
+			with open(filename + '.tmp', 'wb') as f:
+				np.save(f, column)
+			os.replace(filename + '.tmp', filename)
+		_write_metadata(path, self._sequence_length, self.metadata, self.keys,
+			self.key_name, None if self.keys is None else self._key_offsets.tolist(),
+			self.compact, self.population_names)
+
 
 	def plot_karyotypes(self, sample_pair,
 		colors=None, pop_labels=None, title=None, length_in_Mb=True,
-		outfile=None, height=12, width=20):
+		outfile=None, height=12, width=20, min_tract_pixels=None):
 		"""
-		.. note::
-			Diploid only for now.
-
-		Creates a plot of the ancestry tracts in a sample pair of chromosomes
-		using ``matplotlib``.
+		Creates a plot of the ancestry tracts in a set of sample chromosomes
+		using ``matplotlib``. Each sample is drawn on its own row.
+		See :meth:`tspop.plot_genome` for plots of several chromosomes.
 
-		:param sample_pair: a pair of sample node IDs in the PopAncestry object.
+		:param sample_pair: the sample node IDs to plot, usually the pair of
+			chromosomes of a diploid individual. Any number of samples can be given.
 		:type sample_pair: list(int)
 		:param colors: A list of pyplot-compatible colours to use for the ancestral
-			populations, given in order of their appearance in the :attr:`tspop.PopAncestry.squashed_table`.
+			populations, indexed by population ID.
 			If None, uses the default matplotlib colour cycle.
 		:type colors: list(str)
-		:param pop_labels: Ancestral population labels for the plot legend. If None,
-			defaults to Pop0, Pop1 etc.
+		:param pop_labels: Ancestral population labels for the plot legend, indexed
+			by population ID. If None, defaults to Pop0, Pop1 etc.
 		:type pop_labels: list(str)
 		:param title: The title of the plot. If None, defaults to
 			'Ancestry in admixed individual'.
@@ -283,119 +2172,543 @@ class PopAncestry(object):
 		:type height: float
 		:param width: The width of the figure in inches.
 		:type width: float
+		:param min_tract_pixels: If given, tracts narrower than this many pixels
+			are merged into a neighbouring tract, which keeps plots of very many
+			tracts responsive without leaving gaps.
+		:type min_tract_pixels: float
 		:returns: a matplotlib figure.
 		"""
-		# Set keyword arguments and default values
-		if colors is None:
-			prop_cycle = plt.rcParams['axes.prop_cycle']
-			colors = prop_cycle.by_key()['color']
-		# assert len(colors) == self.num_ancestral_pops
-
-		if pop_labels is None:
-			pop_labels = [f'Pop{i}' for i in range(self.num_ancestral_pops)]
-		# assert len(pop_labels) == self.num_ancestral_pops
-
-		if title is None:
-			title = 'Ancestry in admixed individual'
-
-		chrom_labels = {sample_pair[0]: 'chr1', sample_pair[1]: 'chr2'}
-		length = self._sequence_length
-
-		# Initialise plot
-		fig, (chr0, chr1) = plt.subplots(2, figsize=(width, height))
-		fig.suptitle(title, fontsize=18)
-		fig.frameon=False
-		fig.legend(
-			handles = [Polygon(xy = np.array([[0,0],[0,1],[1,1],[1,0]]), color = i) for i in colors],
-			labels = pop_labels,
-			loc = 'right',
-			fontsize = 14
-		)
-
-		# Subset data down to just the two specified samples
-		st = self.squashed_table[self.squashed_table['sample'].isin(sample_pair)]
-
-		for ind, row in st.iterrows():
-			chunk = np.array([[row['left']/length, 0], [row['right']/length, 0],
-							  [row['right']/length, 1], [row['left']/length, 1]])
-			if chrom_labels[row['sample']] == 'chr1':
-				chr0.add_patch(Polygon(xy=chunk, color = colors[int(row['population'])]))
-			elif chrom_labels[row['sample']] == 'chr2':
-				chr1.add_patch(Polygon(xy=chunk, color = colors[int(row['population'])]))
-
-		chr0.set_ylabel('Sample 1', fontsize=16)
-		chr0.tick_params(left=False, bottom=False, labelleft=False, labelbottom=False)
-		chr1.set_xticks(ticks= [0.25, 0.5, 0.75, 1.0])
-		if length_in_Mb:
-			chr1.set_xticklabels([round(i*self._sequence_length*1e-6/4, 1) for i in range(1, 5)],
-				fontsize=16)
-			chr1.set_xlabel('Chromosomal position (Mb)', fontsize=16)
-		else:
-			chr1.set_xticklabels([i*self._sequence_length/4 for i in range(1, 5)])
-			chr1.set_xlabel('Chromosomal position (bases)', fontsize=16)
-		chr1.set_ylabel('Sample 2', fontsize=16)
-		chr1.tick_params(left=False, labelleft=False)
+		return plot_genome([self], sample_pair, colors=colors,
+			pop_labels=pop_labels, title=title, length_in_Mb=length_in_Mb,
+			outfile=outfile, height=height, width=width,
+			min_tract_pixels=min_tract_pixels)
+
+def plot_genome(pop_ancestries, samples, colors=None, pop_labels=None,
+	chrom_labels=None, title=None, length_in_Mb=True, outfile=None,
+	height=12, width=20, min_tract_pixels=None):
+	"""
+	Creates a plot of the ancestry tracts of a set of samples over several
+	chromosomes using ``matplotlib``. Samples are drawn in rows and
+	chromosomes in columns, with widths proportional to their lengths.
+	The tracts of each panel are drawn as a single collection of polygons.
 
-		plt.subplots_adjust(top = 0.8, bottom = 0.2, right = 0.85, left = 0.05, 
-            hspace = .2, wspace = .2)
+	:param pop_ancestries: One :class:`tspop.PopAncestry` object per chromosome.
+	:type pop_ancestries: list(tspop.PopAncestry)
+	:param samples: The sample node IDs to plot.
+	:type samples: list(int)
+	:param chrom_labels: Chromosome labels for the column titles. If None,
+		defaults to chr1, chr2 etc. The titles are only shown if there is more
+		than one chromosome.
+	:type chrom_labels: list(str)
 
-		if outfile is None:
-			plt.show()
+	All other parameters are as in :meth:`tspop.PopAncestry.plot_karyotypes`.
+
+	:returns: a matplotlib figure.
+	"""
+	import matplotlib.pyplot as plt
+	from matplotlib.collections import PolyCollection
+	from matplotlib.colors import to_rgba_array
+	from matplotlib.patches import Polygon
+
+	# Set keyword arguments and default values
+	if colors is None:
+		prop_cycle = plt.rcParams['axes.prop_cycle']
+		colors = prop_cycle.by_key()['color']
+	rgba = to_rgba_array(colors)
+
+	pops = np.unique(np.concatenate(
+		[np.asarray(p.ancestral_pops, dtype=np.int64) for p in pop_ancestries]))
+	if pop_labels is None:
+		pop_labels = [f'Pop{i}' for i in range(max(pops, default=-1) + 1)]
+
+	if title is None:
+		title = 'Ancestry in admixed individual'
+
+	if chrom_labels is None:
+		chrom_labels = [f'chr{j + 1}' for j in range(len(pop_ancestries))]
+	lengths = [p._sequence_length for p in pop_ancestries]
+
+	# Initialise plot
+	fig, axes = plt.subplots(len(samples), len(pop_ancestries),
+		figsize=(width, height), squeeze=False,
+		gridspec_kw={'width_ratios': lengths})
+	fig.suptitle(title, fontsize=18)
+	fig.frameon=False
+	fig.legend(
+		handles = [Polygon(xy = np.array([[0,0],[0,1],[1,1],[1,0]]), color = colors[p]) for p in pops],
+		labels = [pop_labels[p] for p in pops],
+		loc = 'right',
+		fontsize = 14
+	)
+	plt.subplots_adjust(top = 0.8, bottom = 0.2, right = 0.85, left = 0.05, 
+		hspace = .2, wspace = .02)
+
+	for j, (p, length) in enumerate(zip(pop_ancestries, lengths)):
+		_, left, right, population = p._get_squashed_columns()
+		starts, ends = p._sample_rows(samples)
+		for i, (a, b) in enumerate(zip(starts, ends)):
+			ax = axes[i, j]
+			l, r, pop = left[a:b], right[a:b], population[a:b]
+			if min_tract_pixels is not None:
+				pixels_per_unit = ax.get_window_extent().width / length
+				l, r, pop = _merge_narrow_tracts(l, r, pop,
+					min_tract_pixels / pixels_per_unit)
+			verts = np.empty((len(l), 4, 2))
+			verts[:, :, 0] = np.stack([l, r, r, l], axis=1)
+			verts[:, :, 1] = [0, 0, 1, 1]
+			facecolors = rgba[pop]
+			ax.add_collection(PolyCollection(
+				verts, facecolors=facecolors, edgecolors=facecolors))
+			ax.set_xlim(0, length)
+			ax.set_ylim(0, 1)
+			ax.tick_params(left=False, labelleft=False)
+			if j == 0:
+				ax.set_ylabel(f'Sample {i + 1}', fontsize=16)
+			if i == 0 and len(pop_ancestries) > 1:
+				ax.set_title(chrom_labels[j], fontsize=16)
+			if i < len(samples) - 1:
+				ax.tick_params(bottom=False, labelbottom=False)
+				continue
+			ax.set_xticks(ticks=[k * length / 4 for k in range(1, 5)])
+			if length_in_Mb:
+				ax.set_xticklabels([round(k*length*1e-6/4, 1) for k in range(1, 5)],
+					fontsize=16)
+				ax.set_xlabel('Chromosomal position (Mb)', fontsize=16)
+			else:
+				ax.set_xticklabels([k*length/4 for k in range(1, 5)])
+				ax.set_xlabel('Chromosomal position (bases)', fontsize=16)
+
+	if outfile is None:
+		plt.show()
+	else:
+		plt.savefig(outfile, format='png', facecolor='white')
+	return fig
+
+def _merge_narrow_tracts(left, right, population, min_length):
+	"""
+	Merges the tracts of a sample shorter than ``min_length`` into the
+	preceding tract of at least that length, or the following one at the
+	start of a run of contiguous tracts. A run with no such tract is drawn
+	as a single tract coloured by its longest tract.
+	"""
+	if len(left) == 0:
+		return left, right, population
+	breaks = np.append(True, left[1:] != right[:-1])
+	block = np.cumsum(breaks) - 1
+	block_left = left[breaks]
+	block_right = right[np.append(breaks[1:], True)]
+	keep = (right - left) >= min_length
+	# The longest tract of each run that has no tract to merge into.
+	order = np.lexsort((left - right, block))
+	longest = order[np.append(True, block[order][1:] != block[order][:-1])]
+	keep[longest[~np.isin(block[longest], block[keep])]] = True
+
+	kept = np.flatnonzero(keep)
+	kept_block = block[kept]
+	first = np.append(True, kept_block[1:] != kept_block[:-1])
+	last = np.append(first[1:], True)
+	new_left = np.where(first, block_left[kept_block], left[kept])
+	new_right = np.where(last, block_right[kept_block],
+		np.append(left[kept][1:], 0))
+	return new_left, new_right, population[kept]
+
+def get_ibd_ancestry(ts, census_time, within=None, between=None,
+	min_span=None, path_aware=False, tolerance=0):
+	"""
+	Finds the segments of genome shared identical-by-descent (IBD) by pairs
+	of samples, and labels each segment with the census population of the
+	shared ancestor.
+
+	Only segments whose most recent common ancestor (MRCA) is no older than the
+	census are returned. Each segment is labelled with the census node that
+	its MRCA inherited from over the segment (or the MRCA itself, if it is a
+	census node), and with that census node's population. Segments are split
+	wherever this census ancestor changes.
+
+	:param tskit.TreeSequence ts: A tree sequence containing census nodes.
+	:param census_time: The time (or times) at which the census nodes are recorded.
+	:type census_time: int or list(int)
+	:param within: As in ``tskit.TreeSequence.ibd_segments``. If neither
+		``within`` nor ``between`` is given, all pairs of samples are used.
+	:type within: list(int)
+	:param between: As in ``tskit.TreeSequence.ibd_segments``.
+	:type between: list(list(int))
+	:param min_span: As in ``tskit.TreeSequence.ibd_segments``.
+	:type min_span: float
+	:param path_aware: If False (the default), adjacent segments with the same
+		MRCA are joined, even if the paths from the samples to the MRCA differ.
+	:type path_aware: bool
+	:param tolerance: See :meth:`tspop.get_pop_ancestry`.
+	:type tolerance: float
+	:returns: a pandas.DataFrame with columns ``sample_a``, ``sample_b``,
+		``left``, ``right``, ``ancestor``, ``census_ancestor`` and ``population``,
+		sorted by pair and then by left coordinate.
+	"""
+	census_nodes, _ = __get_census_nodes(ts, census_time, tolerance)
+	return _ibd_ancestry(ts, census_nodes, within, between, min_span, path_aware)
+
+def iter_ibd_ancestry(ts, census_time, batch_size, samples=None,
+	min_span=None, path_aware=False, tolerance=0):
+	"""
+	Calculates the output of :meth:`tspop.get_ibd_ancestry` for all pairs of
+	samples in batches, so that only one batch of segments is held in memory.
+	Each pair is reported once, in the batch of its first sample.
+
+	:param tskit.TreeSequence ts: A tree sequence containing census nodes.
+	:param census_time: The time (or times) at which the census nodes are recorded.
+	:type census_time: int or list(int)
+	:param batch_size: The number of samples in each batch.
+	:type batch_size: int
+	:param samples: The sample nodes to consider. If None, defaults to all
+		samples in the tree sequence.
+	:type samples: list(int)
+
+	All other parameters are as in :meth:`tspop.get_ibd_ancestry`.
+
+	:returns: an iterator over pandas.DataFrame objects.
+	"""
+	import pandas as pd
+	census_nodes, _ = __get_census_nodes(ts, census_time, tolerance)
+	if samples is None:
+		samples = ts.samples()
+	samples = np.sort(np.asarray(samples, dtype=np.int32))
+	for start in range(0, len(samples), batch_size):
+		batch = samples[start:start + batch_size]
+		rest = samples[start + batch_size:]
+		chunks = [_ibd_ancestry(ts, census_nodes, batch, None, min_span, path_aware)]
+		if len(rest) > 0:
+			chunks.append(_ibd_ancestry(
+				ts, census_nodes, None, [batch, rest], min_span, path_aware))
+		yield pd.DataFrame(_sort_ibd_columns(
+			{k: np.concatenate([c[k] for c in chunks]) for k in chunks[0]}))
+
+def _ibd_ancestry(ts, census_nodes, within, between, min_span, path_aware):
+	import pandas as pd
+	max_time = np.max(_table_column(ts, 'nodes', 'time')[census_nodes], initial=0)
+	ibd_res = ts.ibd_segments(within=within, between=between,
+		max_time=max_time, min_span=min_span, store_segments=True)
+	columns = _ibd_columns(ibd_res)
+	if not path_aware:
+		columns = _join_runs(columns, 'sample_a', 'sample_b', 'ancestor')
+	return pd.DataFrame(_label_ibd_columns(ts, census_nodes, columns))
+
+def _ibd_columns(ibd_res):
+	"""
+	Returns the segments of a ``tskit.IdentitySegments`` object as flat,
+	sorted columns.
+	"""
+	pairs = list(ibd_res.keys())
+	segment_lists = [ibd_res[k] for k in pairs]
+	counts = np.array([len(segs) for segs in segment_lists], dtype=np.int64)
+	pairs = np.array(pairs, dtype=np.int32).reshape(-1, 2)
+	def column(name, dtype):
+		return np.concatenate([np.asarray(getattr(segs, name), dtype=dtype)
+			for segs in segment_lists] + [np.array([], dtype=dtype)])
+	return _sort_ibd_columns({
+		'sample_a': np.repeat(pairs[:, 0], counts),
+		'sample_b': np.repeat(pairs[:, 1], counts),
+		'left': column('left', np.float64),
+		'right': column('right', np.float64),
+		'ancestor': column('node', np.int32)
+	})
+
+def _sort_ibd_columns(columns):
+	order = np.lexsort(
+		(columns['left'], columns['sample_b'], columns['sample_a']))
+	return {k: v[order] for k, v in columns.items()}
+
+def _label_ibd_columns(ts, census_nodes, columns):
+	"""
+	Labels each IBD segment with the census node its MRCA inherits from,
+	and with that node's population. Segments are split where the census
+	node changes, and are labelled -1 if the MRCA has no census ancestor.
+	"""
+	population_ids = _table_column(ts, 'nodes', 'population')
+	ancestor = columns['ancestor']
+	is_census = np.zeros(ts.num_nodes, dtype=bool)
+	is_census[census_nodes] = True
+
+	mrcas = np.unique(ancestor[~is_census[ancestor]])
+	links = _census_links(ts, mrcas, census_nodes, is_census)
+	segment, j, left, right = _overlay_intervals(ancestor, columns['left'],
+		columns['right'], links['child'], links['left'], links['right'])
+
+	# Census MRCAs, and MRCAs with no census ancestor, keep a single row.
+	unlinked = np.ones(len(ancestor), dtype=bool)
+	unlinked[segment] = False
+	unlinked = np.flatnonzero(unlinked)
+	segment = np.concatenate([segment, unlinked])
+	census_ancestor = np.concatenate([links['parent'][j],
+		np.where(is_census[ancestor[unlinked]], ancestor[unlinked], tskit.NULL)])
+	out = {k: v[segment] for k, v in columns.items()}
+	out['left'] = np.concatenate([left, columns['left'][unlinked]])
+	out['right'] = np.concatenate([right, columns['right'][unlinked]])
+	out['census_ancestor'] = census_ancestor.astype(np.int32)
+	out['population'] = np.where(census_ancestor == tskit.NULL, tskit.NULL,
+		population_ids[census_ancestor]).astype(np.int32)
+	return _sort_ibd_columns(out)
+
+def _census_links(ts, nodes, census_nodes, is_census):
+	"""
+	Returns the columns of a table linking each of the given nodes to the
+	census nodes it inherits from, sorted by child and then by left coordinate.
+	"""
+	links = _link_ancestors(ts, nodes, census_nodes)
+	links = {
+		'child': links.child,
+		'left': links.left,
+		'right': links.right,
+		'parent': links.parent
+	}
+	links = {k: v[~is_census[links['child']]] for k, v in links.items()}
+	# link_ancestors also links given nodes to each other. Follow these
+	# links up to the census.
+	# Links are split where they passed through different intermediate nodes.
+	return _join_runs(_follow_links(_sort_links(links), is_census), 'child', 'parent')
+
+def _follow_links(links, stop, node_links=None):
+	"""
+	Replaces each link whose parent is not a ``stop`` node with the links
+	of that parent, one generation at a time, until every link ends at a
+	``stop`` node. The parents' links are taken from ``node_links`` or, if
+	None, from the links themselves. Both must be sorted by child and then
+	by left coordinate.
+	"""
+	pending = ~stop[links['parent']]
+	while np.any(pending):
+		if node_links is None:
+			parent_links = links
 		else:
-			plt.savefig(outfile, format='png', facecolor='white')
-
-def _plot_ancestry_chunk(row, chrom):
-	l = row.left/seq_length
-	r = row.right/seq_length
-	p = row.population
-	if int(p) == 0:
-		c = 'blue'
-	elif int(p) == 1:
-		c = 'red'
-	print('p is', p)
-	chunk = np.array([[l, 0], [r, 0], [r, 1], [l, 1]])
-	chrom.add_patch(Polygon(xy=chunk, color = c))
-
-def _sort_ibd_segments(ibd_res):
-	# Returns a dictionary of sorted ibd segments.
-	res = {}
-	for k in ibd_res.pairs:
-		segs = []
-		for s in ibd_res[k]:
-			segs.append(s)
-		segs = sorted(segs)
-		res[(k[0], k[1])] = segs
-	return res
+			parent_links = node_links
+		done = {k: v[~pending] for k, v in links.items()}
+		todo = {k: v[pending] for k, v in links.items()}
+		i, j, left, right = _overlay_intervals(todo['parent'], todo['left'],
+			todo['right'], parent_links['child'], parent_links['left'],
+			parent_links['right'])
+		links = _sort_links({
+			'child': np.concatenate([done['child'], todo['child'][i]]),
+			'left': np.concatenate([done['left'], left]),
+			'right': np.concatenate([done['right'], right]),
+			'parent': np.concatenate([done['parent'], parent_links['parent'][j]])
+		})
+		pending = ~stop[links['parent']]
+	return links
+
+def _sort_links(links):
+	order = np.lexsort((links['left'], links['child']))
+	return {k: v[order] for k, v in links.items()}
+
+def _overlay_intervals(node, left, right, link_node, link_left, link_right):
+	"""
+	Finds every overlap between the intervals [``left``, ``right``) of the given
+	nodes and the link intervals of the same nodes, which must be sorted by
+	node and then by left coordinate, and must not overlap within a node.
+	Returns the indices of the overlapping interval and link, and the
+	coordinates of the overlap.
+	"""
+	# The overlapping links are found with a single searchsorted, using
+	# integer keys that combine the node with the rank of the coordinate.
+	coords = np.unique(np.concatenate([left, right, link_left, link_right]))
+	stride = np.int64(len(coords))
+	def key(n, x):
+		return np.asarray(n, dtype=np.int64) * stride + np.searchsorted(coords, x)
+	lo = np.searchsorted(key(link_node, link_right), key(node, left), side='right')
+	hi = np.searchsorted(key(link_node, link_left), key(node, right), side='left')
+	counts = np.maximum(hi - lo, 0)
+	i = np.repeat(np.arange(len(node)), counts)
+	j = lo[i] + np.arange(len(i)) - np.repeat(np.cumsum(counts) - counts, counts)
+	return (i, j, np.maximum(left[i], link_left[j]),
+		np.minimum(right[i], link_right[j]))
 
 def _path_agnostic_ibd(ibd_res):
+	import pandas as pd
 	# Returns a dictionary of squashed IBD segments.
-	sorted_res = sort_ibd_segments(ibd_res)
-
+	columns = _join_runs(_ibd_columns(ibd_res), 'sample_a', 'sample_b', 'ancestor')
+	pairs = np.stack([columns['sample_a'], columns['sample_b']], axis=1)
+	keys, starts = np.unique(pairs, axis=0, return_index=True)
+	ends = np.append(starts[1:], len(pairs))
 	out_dict = {} 
-	for k in sorted_res.keys():
-		new_left = []
-		new_right = []
-		node = []
-
-		segs = sorted_res[k]
-		for i, s in enumerate(segs):
-			if (i > 0 and s.left==new_right[-1] and s.node==node[-1]):
-				new_right[-1] = s.right
-			else:
-				new_left.append(s.left)
-				new_right.append(s.right)
-				node.append(s.node)
-
+	for (a, b), start, end in zip(keys, starts, ends):
 		ibd_table = pd.DataFrame({
-			'left' : new_left,
-			'right' : new_right,
-			'ancestor' : node
+			'left' : columns['left'][start:end],
+			'right' : columns['right'][start:end],
+			'ancestor' : columns['ancestor'][start:end]
 		})
 		ibd_table = ibd_table.astype({
 			'left' : float,
 			'right' : float,
 			'ancestor' : int
 			})
-		out_dict[k] = ibd_table
+		out_dict[(int(a), int(b))] = ibd_table
 
 	return out_dict
+
+# The suffix of the output file written by the command line program for
+# each output format.
+_CLI_SUFFIXES = {
+	'squashed': '.squashed.csv',
+	'ancestry': '.ancestry.csv',
+	'msp': '.msp.tsv',
+	'fb': '.fb.tsv',
+	'vcf': '.vcf',
+	'dump': '.tspop'
+}
+
+def main(argv=None):
+	"""
+	Runs the ``tspop`` command line program, which calculates population-based
+	ancestry for one or more tree sequence files and writes it to an output
+	directory (see :ref:`commandline`). The files are processed in parallel
+	by ``--num-workers`` worker processes. Each worker loads its own files,
+	so nothing but the file names and the timings is passed between processes.
+
+	A line is printed for each file as it finishes, giving the output
+	file, the number of samples and output rows, and the time spent loading
+	the file, calculating the ancestry and writing the output.
+
+	:param argv: The command line arguments. Defaults to ``sys.argv[1:]``.
+	:type argv: list(str)
+	:returns: the exit status: 0 if all files were processed, and 1 otherwise.
+	"""
+	parser = _cli_parser()
+	args = parser.parse_args(argv)
+	if args.format == 'dump' and args.compression is not None:
+		parser.error("the dump format cannot be compressed")
+	if args.num_workers < 1:
+		parser.error("--num-workers must be at least 1")
+	options = {
+		'census_time': args.census_time,
+		'tolerance': args.tolerance,
+		'samples': args.samples,
+		'population': args.population,
+		'format': args.format,
+		'output_dir': args.output_dir,
+		'compression': args.compression,
+		'compact': args.compact
+	}
+	os.makedirs(args.output_dir, exist_ok=True)
+
+	print('file\toutput\tsamples\trows\tload_seconds\tancestry_seconds\twrite_seconds',
+		flush=True)
+	status = 0
+	def report(path, result):
+		nonlocal status
+		try:
+			record = result()
+		except Exception as e:
+			print(f"tspop: error: {path}: {e}", file=sys.stderr, flush=True)
+			status = 1
+			return
+		print('{file}\t{output}\t{samples}\t{rows}\t{load_seconds:.3f}\t'
+			'{ancestry_seconds:.3f}\t{write_seconds:.3f}'.format(**record), flush=True)
+
+	if args.num_workers == 1:
+		for path in args.trees:
+			report(path, lambda: _cli_process_file(path, options))
+	else:
+		with concurrent.futures.ProcessPoolExecutor(max_workers=args.num_workers) as pool:
+			futures = {pool.submit(_cli_process_file, path, options): path
+				for path in args.trees}
+			for future in concurrent.futures.as_completed(futures):
+				report(futures[future], future.result)
+	return status
+
+def _cli_parser():
+	import argparse
+	parser = argparse.ArgumentParser(prog='tspop',
+		description='Calculates population-based ancestry for each of the given '
+		'tree sequence files, writing one output per file.')
+	parser.add_argument('trees', nargs='+',
+		help='the tree sequence files to process')
+	parser.add_argument('-c', '--census-time', type=float, nargs='+', required=True,
+		help='the time (or times) at which the census nodes are recorded')
+	parser.add_argument('--tolerance', type=float, default=0,
+		help='treat nodes within this distance of a census time as census nodes')
+	selection = parser.add_mutually_exclusive_group()
+	selection.add_argument('-s', '--samples', type=int, nargs='+',
+		help='the sample node IDs to calculate ancestry for (default: all samples)')
+	selection.add_argument('-p', '--population',
+		help='only calculate ancestry for the samples in this population, '
+		'given by name or ID')
+	parser.add_argument('-f', '--format', choices=list(_CLI_SUFFIXES), default='squashed',
+		help='the output format: the squashed or ancestry table as csv, RFMix msp '
+		'or fb files at the site positions, a VCF with an ANC field, or a directory '
+		'written by PopAncestry.dump (default: squashed)')
+	parser.add_argument('-o', '--output-dir', default='.',
+		help='the directory to write the output files to (default: .)')
+	parser.add_argument('--compression', choices=['gzip', 'bgzip'],
+		help='compress the text output files')
+	parser.add_argument('--compact', action='store_true',
+		help='store the output in compact form, with population names')
+	parser.add_argument('-j', '--num-workers', type=int, default=1,
+		help='the number of files to process in parallel (default: 1)')
+	return parser
+
+def _cli_output_path(path, options):
+	name = os.path.basename(path)
+	if name.endswith('.trees'):
+		name = name[:-len('.trees')]
+	name += _CLI_SUFFIXES[options['format']]
+	if options['compression'] is not None:
+		name += '.gz'
+	return os.path.join(options['output_dir'], name)
+
+def _cli_samples(ts, samples, population):
+	"""
+	Returns the sample nodes selected on the command line, or None if all
+	samples are used.
+	"""
+	if samples is not None:
+		return np.unique(np.asarray(samples, dtype=np.int32))
+	if population is not None:
+		names = _population_names(ts)
+		if population in names:
+			pop_id = names.index(population)
+		elif population.isdigit() and int(population) < ts.num_populations:
+			pop_id = int(population)
+		else:
+			raise ValueError(f"There is no population {population}.")
+		return ts.samples(population=pop_id)
+	return None
+
+def _cli_process_file(path, options):
+	"""
+	Calculates and writes the ancestry of a single tree sequence file,
+	returning the timings of each step.
+	"""
+	start = time.perf_counter()
+	ts = tskit.load(path)
+	samples = _cli_samples(ts, options['samples'], options['population'])
+	loaded = time.perf_counter()
+	local_ancestry = get_pop_ancestry(ts, options['census_time'],
+		tolerance=options['tolerance'], compact=options['compact'], samples=samples)
+	calculated = time.perf_counter()
+
+	output = _cli_output_path(path, options)
+	compression = options['compression']
+	fmt = options['format']
+	if fmt == 'dump':
+		local_ancestry.dump(output)
+	elif fmt in ('squashed', 'ancestry'):
+		table = getattr(local_ancestry, fmt + '_table')
+		with _open_output(output, compression) as f:
+			table.to_csv(f, index=False)
+	elif fmt == 'vcf':
+		local_ancestry.write_vcf(ts, output, compression=compression)
+	else:
+		if ts.num_sites == 0:
+			raise ValueError("The tree sequence has no sites to write ancestry at.")
+		getattr(local_ancestry, 'write_' + fmt)(output, ts, compression=compression)
+	finished = time.perf_counter()
+	return {
+		'file': path,
+		'output': output,
+		'samples': len(local_ancestry.samples),
+		'rows': len(local_ancestry.sample),
+		'load_seconds': loaded - start,
+		'ancestry_seconds': calculated - loaded,
+		'write_seconds': finished - calculated
+	}
+
+if __name__ == '__main__':
+	sys.exit(main())
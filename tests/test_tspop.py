@@ -5,6 +5,11 @@ import tskit
 import pytest
 import pandas as pd
 import io
+import os
+import subprocess
+import sys
+import gzip
+import numpy as np
 
 # a test tree sequence.
 def sim_ts():
@@ -57,6 +62,28 @@ class TestBasicUsage():
 			tspop.PopAncestry(
 				left=[0], right=[], population=[], ancestor=[], child=[])
 
+	def test_ancestry_table_length_mismatch(self):
+		with pytest.raises(ValueError):
+			tspop.PopAncestry(
+				left=[0], right=[], population=[], ancestor=[], child=[],
+				sample_nodes=[], sequence_length=1)
+
+	def test_tables_sorted_and_lazy(self):
+		t = tspop.PopAncestry(
+			left=[5, 0, 0], right=[10, 5, 10], population=[1, 1, 0],
+			ancestor=[7, 6, 8], child=[0, 0, 1],
+			sample_nodes=[0, 1], sequence_length=10)
+		assert t._ancestry_table is None
+		assert t._squashed_table is None
+		assert t.calculate_ancestry_fraction(population=1) == 1
+		assert t._ancestry_table is None
+		assert list(t.ancestry_table['ancestor']) == [6, 7, 8]
+		assert t.ancestry_table is t.ancestry_table
+		assert list(t.squashed_table['right']) == [10, 10]
+		assert t.ancestors == [6, 7, 8]
+		assert t.ancestral_pops == [0, 1]
+		assert t.coverage == 20
+
 	def test_pop_ancestry(self):
 		print("PopAncestry summary info:")
 		print(self.p)
@@ -83,18 +110,659 @@ class TestBasicUsage():
 		p1 = self.p.calculate_ancestry_fraction(population=1, sample=2)
 		assert pytest.approx(p0 + p1) == 1
 
+	def test_ancestry_fractions(self):
+		f = self.p.calculate_ancestry_fractions()
+		assert list(f.columns) == [0, 1]
+		assert list(f.index) == sorted(set(self.p.squashed_table['sample']))
+		assert pytest.approx(f.sum(axis=1).to_numpy()) == 1
+		st = self.p.squashed_table
+		st = st[(st['sample'] == 2) & (st.population == 0)]
+		assert pytest.approx(f.loc[2, 0]) == sum(st.right - st.left) / self.ts_ex.sequence_length
+		assert f.loc[2, 0] == self.p.calculate_ancestry_fraction(population=0, sample=2)
+
+	def test_ancestry_fractions_individuals(self):
+		f = self.p.calculate_ancestry_fractions(ts=self.ts_ex)
+		fs = self.p.calculate_ancestry_fractions()
+		assert len(f) == self.ts_ex.num_individuals
+		for ind in self.ts_ex.individuals():
+			assert pytest.approx(f.loc[ind.id, 0]) == fs.loc[list(ind.nodes), 0].mean()
+
 	def test_ancestry_fraction_errors(self):
 		with pytest.raises(ValueError):
 			self.p.calculate_ancestry_fraction(population=4)
 		with pytest.raises(ValueError):
 			self.p.calculate_ancestry_fraction(population=0, sample=40)
 
+	def test_census_time_list(self):
+		p = tspop.get_pop_ancestry(self.ts_ex, [self.census_time])
+		pd.testing.assert_frame_equal(p.squashed_table, self.p.squashed_table)
+		pd.testing.assert_frame_equal(p.ancestry_table, self.p.ancestry_table)
+
+	def test_census_time_tolerance(self):
+		p = tspop.get_pop_ancestry(self.ts_ex, self.census_time + 0.5, tolerance=1)
+		pd.testing.assert_frame_equal(p.squashed_table, self.p.squashed_table)
+		with pytest.raises(ValueError):
+			tspop.get_pop_ancestry(self.ts_ex, [])
+
+	def test_several_census_times(self):
+		# Samples are assigned to the more recent census.
+		p = tspop.get_pop_ancestry(self.ts_ex, [self.census_time, 600.5], tolerance=0.5)
+		assert set(p.ancestry_table['sample']) <= set(self.ts_ex.samples())
+		pd.testing.assert_frame_equal(p.squashed_table, self.p.squashed_table)
+
+	def test_windows(self):
+		L = self.ts_ex.sequence_length
+		windows = [0, L / 7, L / 3, L / 2, L]
+		p = tspop.get_pop_ancestry(self.ts_ex, self.census_time, windows=windows)
+		pd.testing.assert_frame_equal(p.ancestry_table, self.p.ancestry_table)
+		pd.testing.assert_frame_equal(p.squashed_table, self.p.squashed_table)
+
+	def test_iter_pop_ancestry(self):
+		L = self.ts_ex.sequence_length
+		windows = [0, L / 4, L / 2, L]
+		chunks = list(tspop.iter_pop_ancestry(self.ts_ex, self.census_time, windows))
+		assert len(chunks) == 3
+		# Completed tracts are yielded in the window they end in.
+		for chunk, right in zip(chunks, windows[1:]):
+			assert all(chunk.right <= right)
+		assert sum(len(c.left) for c in chunks) == len(self.p.left)
+
+	def test_bad_windows(self):
+		L = self.ts_ex.sequence_length
+		for windows in [[0], [1, L], [0, L / 2], [0, L / 2, L / 4, L]]:
+			with pytest.raises(ValueError):
+				tspop.get_pop_ancestry(self.ts_ex, self.census_time, windows=windows)
+
+	def test_get_pop_ancestry_samples(self):
+		L = self.ts_ex.sequence_length
+		samples = [15, 16, 17, 30]
+		expected = self.p.subset(samples)
+		for kwargs in [{}, {'windows': [0, 2e6, L]}, {'num_workers': 2},
+				{'num_workers': 2, 'windows': [0, L / 3, L]}]:
+			p = tspop.get_pop_ancestry(self.ts_ex, self.census_time,
+				samples=samples, **kwargs)
+			assert list(p.samples) == samples
+			pd.testing.assert_frame_equal(p.ancestry_table, expected.ancestry_table)
+			pd.testing.assert_frame_equal(p.squashed_table, expected.squashed_table)
+		p = tspop.get_pop_ancestry(self.ts_ex, self.census_time, samples=samples,
+			by_census=True, compact=True)[self.census_time]
+		np.testing.assert_array_equal(p.left, expected.left)
+		assert p.population_names == ['SMALL', 'BIG', 'ADMIX', 'ANC']
+		with pytest.raises(ValueError):
+			tspop.get_pop_ancestry(self.ts_ex, self.census_time, samples=[0, 1000])
+
+	def test_num_workers(self):
+		p = tspop.get_pop_ancestry(self.ts_ex, self.census_time, num_workers=3)
+		pd.testing.assert_frame_equal(p.ancestry_table, self.p.ancestry_table)
+		pd.testing.assert_frame_equal(p.squashed_table, self.p.squashed_table)
+		assert list(p.samples) == list(self.p.samples)
+
+	def test_num_workers_windows(self):
+		L = self.ts_ex.sequence_length
+		for num_windows in [2, 3, 8]:
+			windows = np.linspace(0, L, num_windows + 1)
+			for num_workers in [1, 2, 3, 7]:
+				p = tspop.get_pop_ancestry(self.ts_ex, self.census_time,
+					windows=windows, num_workers=num_workers)
+				pd.testing.assert_frame_equal(p.ancestry_table, self.p.ancestry_table)
+				pd.testing.assert_frame_equal(p.squashed_table, self.p.squashed_table)
+
+	def test_iter_pop_ancestry_samples(self):
+		L = self.ts_ex.sequence_length
+		windows = [0, 2e6, L / 2, L]
+		for samples in [[15, 16, 17], [0, 1, 2, 3], list(range(0, 40, 3))]:
+			chunks = list(tspop.iter_pop_ancestry(self.ts_ex, self.census_time,
+				windows, samples=samples))
+			t = pd.concat([c.ancestry_table for c in chunks])
+			t = t.sort_values(['sample', 'left']).reset_index(drop=True)
+			expected = self.p.subset(samples).ancestry_table.reset_index(drop=True)
+			pd.testing.assert_frame_equal(t, expected)
+
+	def test_squashed_table_matches_row_loop(self):
+		t = self.p.ancestry_table.reset_index(drop=True)
+		new_sample, new_left, new_right, new_population = [], [], [], []
+		for ind, row in t.iterrows():
+			if ind > 0 and row['left'] == new_right[-1] and row['population'] == new_population[-1] and row['sample'] == new_sample[-1]:
+				new_right[-1] = row['right']
+			else:
+				new_sample.append(row['sample'])
+				new_left.append(row['left'])
+				new_right.append(row['right'])
+				new_population.append(row['population'])
+		ans = pd.DataFrame({
+			'sample': [int(i) for i in new_sample],
+			'left' : new_left,
+			'right': new_right,
+			'population' : [int(p) for p in new_population]
+		})
+		pd.testing.assert_frame_equal(self.p.squashed_table, ans)
+
+	def test_local_ancestry_at(self):
+		st = self.p.squashed_table
+		positions = [0, 123456.5, 5e6, self.ts_ex.sequence_length - 1]
+		samples = [0, 3, 17]
+		res = self.p.local_ancestry_at(positions, samples=samples)
+		assert res.shape == (3, 4)
+		for i, s in enumerate(samples):
+			for j, x in enumerate(positions):
+				row = st[(st['sample'] == s) & (st.left <= x) & (st.right > x)]
+				assert res[i, j] == row.population.iloc[0]
+		assert self.p.local_ancestry_at(positions).shape == (self.p.num_samples, 4)
+		np.testing.assert_array_equal(
+			self.p.local_ancestry_at(positions[::-1], samples=samples), res[:, ::-1])
+		with pytest.raises(ValueError):
+			self.p.local_ancestry_at([self.ts_ex.sequence_length])
+
+	def test_local_ancestry_at_gaps(self):
+		t = tspop.PopAncestry(
+			left=[2, 6], right=[4, 8], population=[1, 0],
+			ancestor=[7, 6], child=[0, 0],
+			sample_nodes=[0, 1], sequence_length=10)
+		res = t.local_ancestry_at([0, 2, 4, 7, 9])
+		assert res.tolist() == [[-1, 1, -1, 0, -1], [-1] * 5]
+		m = t.local_ancestry_matrix([0, 2, 4, 7, 9], samples=[1, 0, 0], block_size=2)
+		assert m.tolist() == [[255] * 5, [255, 1, 255, 0, 255], [255, 1, 255, 0, 255]]
+		runs = t.local_ancestry_runs([0, 2, 4, 7, 9])
+		assert runs.values.tolist() == [[0, 1, 2, 1], [0, 3, 4, 0]]
+
+	def test_local_ancestry_matrix(self, tmp_path):
+		positions = np.linspace(0, self.ts_ex.sequence_length, 500, endpoint=False)
+		ans = self.p.local_ancestry_at(positions)
+		m = self.p.local_ancestry_matrix(positions)
+		assert m.dtype == np.uint8
+		np.testing.assert_array_equal(m, np.where(ans < 0, 255, ans))
+		m = self.p.local_ancestry_matrix(positions, outfile=tmp_path / 'm.npy',
+			dtype=np.int8, block_size=3)
+		assert isinstance(m, np.memmap)
+		np.testing.assert_array_equal(np.load(tmp_path / 'm.npy'), ans)
+		m = self.p.local_ancestry_matrix(self.ts_ex, samples=[3, 1])
+		assert m.shape == (2, self.ts_ex.num_sites)
+		with pytest.raises(ValueError):
+			self.p.local_ancestry_matrix(positions[::-1])
+
+	def test_local_ancestry_runs(self):
+		positions = np.linspace(0, self.ts_ex.sequence_length, 500, endpoint=False)
+		m = self.p.local_ancestry_matrix(positions, dtype=np.int32)
+		runs = self.p.local_ancestry_runs(positions)
+		assert list(runs.columns) == ['sample', 'start', 'end', 'population']
+		assert np.all(runs.end > runs.start)
+		rebuilt = np.full(m.shape, -1)
+		for s, start, end, pop in runs.itertuples(index=False):
+			rebuilt[list(self.p.samples).index(s), start:end] = pop
+		np.testing.assert_array_equal(rebuilt, m)
+
+	def test_write_msp(self, tmp_path):
+		ts = msprime.sim_mutations(self.ts_ex, rate=1e-8, random_seed=1)
+		positions = ts.tables.sites.position
+		m = self.p.local_ancestry_matrix(positions, dtype=np.int32)
+		for chunk_size in [None, 7]:
+			out = io.StringIO()
+			self.p.write_msp(out, ts, chunk_size=chunk_size)
+			lines = out.getvalue().splitlines()
+			assert lines[0] == '#Subpopulation order/codes: pop0=0\tpop1=1'
+			msp = pd.read_csv(io.StringIO(out.getvalue()), sep='\t', skiprows=1)
+			assert np.sum(msp['n snps']) == len(positions)
+			assert np.all(np.any(msp.iloc[1:, 6:].values != msp.iloc[:-1, 6:].values, axis=1))
+			np.testing.assert_array_equal(
+				np.repeat(msp.iloc[:, 6:].values.T, msp['n snps'], axis=1), m)
+		self.p.write_msp(tmp_path / 'out.msp.tsv.gz', ts, compression='gzip')
+		with gzip.open(tmp_path / 'out.msp.tsv.gz', 'rt') as f:
+			assert f.read() == out.getvalue()
+
+	def test_write_fb(self, tmp_path):
+		ts = msprime.sim_mutations(self.ts_ex, rate=1e-8, random_seed=1)
+		rate_map = msprime.RateMap.uniform(ts.sequence_length, 1e-8)
+		out = io.StringIO()
+		self.p.write_fb(out, ts, rate_map=rate_map, chunk_size=5)
+		fb = pd.read_csv(io.StringIO(out.getvalue()), sep='\t', skiprows=1)
+		assert list(fb.columns[4:6]) == ['0:::pop0', '0:::pop1']
+		np.testing.assert_allclose(fb.genetic_position, fb.physical_position * 1e-6)
+		probs = fb.iloc[:, 4:].values.reshape(ts.num_sites, -1, 2)
+		np.testing.assert_array_equal(probs.argmax(axis=2).T,
+			self.p.local_ancestry_matrix(ts))
+		with pytest.raises(ValueError):
+			self.p.write_fb(tmp_path / 'out.fb.tsv', ts, compression='zip')
+
+	def test_write_vcf(self):
+		ts = msprime.sim_mutations(self.ts_ex, rate=1e-8, random_seed=1)
+		out = io.StringIO()
+		self.p.write_vcf(ts, out, chunk_size=6)
+		lines = out.getvalue().splitlines()
+		assert any(l.startswith('##FORMAT=<ID=ANC') for l in lines)
+		records = [l.split('\t') for l in lines if not l.startswith('#')]
+		assert len(records) == ts.num_sites
+		assert all(r[8] == 'GT:ANC' for r in records)
+		anc = [[int(a) for c in r[9:] for a in c.split(':')[1].split('|')] for r in records]
+		np.testing.assert_array_equal(np.array(anc).T, self.p.local_ancestry_matrix(ts))
+		plain = io.StringIO()
+		ts.write_vcf(plain)
+		genotypes = [[c.split(':')[0] for c in r[9:]] for r in records]
+		assert genotypes == [l.split('\t')[9:] for l in plain.getvalue().splitlines()
+			if not l.startswith('#')]
+
+	def test_tracts_overlapping(self):
+		st = self.p.squashed_table
+		left, right = 2e6, 3e6
+		ans = st[(st.left < right) & (st.right > left)].reset_index(drop=True)
+		pd.testing.assert_frame_equal(self.p.tracts_overlapping(left, right), ans)
+		res = self.p.tracts_overlapping(left, right, samples=[5])
+		assert set(res['sample']) == {5}
+		p = tspop.concat([self.p, self.p], keys=['chr1', 'chr2'], key_name='chromosome')
+		p.population_names = ['SMALL', 'BIG', 'ADMIX', 'ANC']
+		L = self.ts_ex.sequence_length
+		st = p.squashed_table
+		ans = st[(st.chromosome == 'chr2') & (st.left < right) & (st.right > left)]
+		pd.testing.assert_frame_equal(p.tracts_overlapping(L + left, L + right),
+			ans.reset_index(drop=True))
+
+	def test_dump_load(self, tmp_path):
+		self.p.dump(tmp_path / 'out')
+		for mmap in [True, False]:
+			p = tspop.load(tmp_path / 'out', mmap=mmap)
+			pd.testing.assert_frame_equal(p.ancestry_table, self.p.ancestry_table)
+			pd.testing.assert_frame_equal(p.squashed_table, self.p.squashed_table)
+			assert list(p.samples) == list(self.p.samples)
+			assert p.total_genome_length == self.p.total_genome_length
+			assert p.metadata == {}
+		assert isinstance(tspop.load(tmp_path / 'out').left, np.memmap)
+
+	def test_dump_over_loaded(self, tmp_path):
+		out = tmp_path / 'out'
+		self.p.dump(out)
+		tspop.load(out).dump(out)
+		p = tspop.load(out, mmap=False)
+		pd.testing.assert_frame_equal(p.ancestry_table, self.p.ancestry_table)
+		pd.testing.assert_frame_equal(p.squashed_table, self.p.squashed_table)
+		tspop.load(out).subset([2, 3, 4]).dump(out)
+		p = tspop.load(out, mmap=False)
+		pd.testing.assert_frame_equal(p.squashed_table,
+			self.p.subset([2, 3, 4]).squashed_table)
+		assert not any(f.suffix == '.tmp' for f in out.iterdir())
+
+	def test_dump_pop_ancestry(self, tmp_path):
+		self.ts_ex.dump(tmp_path / 'ex.trees')
+		for kwargs in [{}, {'memory_budget': 10**5},
+				{'batch_size': 3, 'windows': [0, 2e6, self.ts_ex.sequence_length]}]:
+			p = tspop.dump_pop_ancestry(str(tmp_path / 'ex.trees'), self.census_time,
+				tmp_path / 'out', **kwargs)
+			assert isinstance(p.left, np.memmap)
+			assert not any(f.suffix == '.raw' for f in (tmp_path / 'out').iterdir())
+			np.testing.assert_array_equal(p.samples, self.p.samples)
+			for name in tspop._COLUMNS:
+				np.testing.assert_array_equal(getattr(p, name), getattr(self.p, name))
+			pd.testing.assert_frame_equal(p.squashed_table, self.p.squashed_table)
+
+	def test_dump_load_metadata(self, tmp_path):
+		t = tspop.PopAncestry(
+			left=[0], right=[1], population=[0], ancestor=[3], child=[0],
+			sample_nodes=[0], sequence_length=1, metadata={'census_time': 201})
+		t.dump(tmp_path)
+		assert tspop.load(tmp_path).metadata == {'census_time': 201}
+		with pytest.raises(FileNotFoundError):
+			tspop.load(tmp_path / 'missing')
+		(tmp_path / 'metadata.json').write_text('{"format_name": "other"}')
+		with pytest.raises(ValueError):
+			tspop.load(tmp_path)
+
+	def test_by_census(self):
+		demography = msprime.Demography()
+		for name, size in [("SMALL", 200), ("BIG", 500), ("ADMIX", 200), ("ANC", 500)]:
+			demography.add_population(name=name, initial_size=size)
+		demography.add_census(time=100)
+		demography.add_admixture(time=200, derived="ADMIX",
+			ancestral=["SMALL", "BIG"], proportions=[0.5, 0.5])
+		demography.add_census(time=201)
+		demography.add_census(time=400)
+		demography.add_population_split(time=600, derived=["SMALL", "BIG"],
+			ancestral="ANC")
+		ts = msprime.sim_ancestry(samples={"ADMIX": 10}, demography=demography,
+			random_seed=5, sequence_length=1e7, recombination_rate=3e-8)
+		out = tspop.get_pop_ancestry(ts, [400, 100, 201], by_census=True)
+		assert list(out) == [100, 201, 400]
+		for census_time, p in out.items():
+			ans = tspop.get_pop_ancestry(ts, census_time)
+			pd.testing.assert_frame_equal(p.ancestry_table, ans.ancestry_table)
+			pd.testing.assert_frame_equal(p.squashed_table, ans.squashed_table)
+		assert out[100].ancestral_pops == [2]
+		assert tspop.get_pop_ancestry(ts, [100, 201], by_census=True,
+			compact=True)[201].compact
+		with pytest.raises(ValueError):
+			tspop.get_pop_ancestry(ts, [100, 201], by_census=True, num_workers=2)
+
+	def test_profile(self):
+		assert self.p.profile is None
+		p = tspop.get_pop_ancestry(self.ts_ex, self.census_time, profile=True)
+		pd.testing.assert_frame_equal(p.ancestry_table, self.p.ancestry_table)
+		p.squashed_table
+		stages = [r['stage'] for r in p.profile]
+		assert stages == ['census_nodes', 'link_ancestors', 'sample_links', 'sort',
+			'summaries', 'ancestry_table', 'squash_tracts', 'squashed_table']
+		for r in p.profile:
+			assert r['seconds'] >= 0 and r['peak_memory'] >= 0
+		assert p.profile[-1]['rows'] == len(p.squashed_table)
+
+	def test_progress(self):
+		records = []
+		windows = np.linspace(0, self.ts_ex.sequence_length, 4)
+		tspop.get_pop_ancestry(self.ts_ex, self.census_time, windows=windows,
+			progress=records.append)
+		assert [r['window'] for r in records if r['stage'] == 'window'] == [0, 1, 2]
+		assert all(r['peak_memory'] is None for r in records)
+		assert tspop.get_pop_ancestry(self.ts_ex, self.census_time).profile is None
+		p = tspop.get_pop_ancestry(self.ts_ex, self.census_time, progress=records.append)
+		assert p.profile is None
+
+	def test_progress_num_workers(self, tmp_path):
+		# The records are written to a file, so that calls made in worker
+		# processes would be seen too.
+		log = tmp_path / 'progress.txt'
+		def progress(record):
+			with open(log, 'a') as f:
+				f.write(f"{os.getpid()} {record['stage']}\n")
+		p = tspop.get_pop_ancestry(self.ts_ex, self.census_time, num_workers=2,
+			progress=progress)
+		p.squashed_table
+		p.ancestry_table
+		lines = [line.split() for line in log.read_text().splitlines()]
+		assert all(int(pid) == os.getpid() for pid, _ in lines)
+		assert [stage for _, stage in lines] == ['census_nodes', 'workers',
+			'concatenate', 'sort', 'summaries']
+		assert p.profile is None and p._profiler is None
+		p = tspop.get_pop_ancestry(self.ts_ex, self.census_time, num_workers=2,
+			profile=True)
+		assert 'squash_tracts' not in [r['stage'] for r in p.profile]
+
+	def test_profile_keeps_caller_tracing(self):
+		import tracemalloc
+		tracemalloc.start()
+		try:
+			data = np.ones(10**6)
+			del data
+			peak = tracemalloc.get_traced_memory()[1]
+			p = tspop.get_pop_ancestry(self.ts_ex, self.census_time, profile=True)
+			assert tracemalloc.is_tracing()
+			assert tracemalloc.get_traced_memory()[1] >= peak >= 8 * 10**6
+		finally:
+			tracemalloc.stop()
+		assert all(r['peak_memory'] is None for r in p.profile)
+
+	def test_compact(self, tmp_path):
+		p = tspop.get_pop_ancestry(self.ts_ex, self.census_time, compact=True)
+		assert p.compact
+		assert p.sample.dtype == np.int16 and p.population.dtype == np.int8
+		assert p.population_names == ['SMALL', 'BIG', 'ADMIX', 'ANC']
+		st = p.squashed_table
+		assert np.shares_memory(st['left'].to_numpy(), p._get_squashed_columns()[1])
+		assert list(st.population.cat.codes) == list(self.p.squashed_table.population)
+		pd.testing.assert_series_equal(
+			p.calculate_ancestry_fractions()[0], self.p.calculate_ancestry_fractions()[0])
+		p.dump(tmp_path / 'out')
+		q = tspop.load(tmp_path / 'out', mmap=False)
+		assert q.compact and q.population_names == p.population_names
+		pd.testing.assert_frame_equal(q.squashed_table, st)
+		assert p.subset([0, 1]).population_names == p.population_names
+
+	def test_compact_integer_coordinates(self):
+		p = tspop.get_pop_ancestry(self.ts_ex, self.census_time,
+			compact=True, integer_coordinates=True)
+		assert p.left.dtype == np.uint32
+		np.testing.assert_array_equal(p.tract_lengths(), self.p.tract_lengths())
+		t = dict(left=[0, 0.5], right=[0.5, 1], population=[0, 1], ancestor=[3, 4],
+			child=[0, 0], sample_nodes=[0], sequence_length=1)
+		with pytest.raises(ValueError):
+			tspop.PopAncestry(**t, compact=True, integer_coordinates=True)
+		with pytest.raises(ValueError):
+			tspop.PopAncestry(**t, integer_coordinates=True)
+		with pytest.raises(ValueError):
+			tspop.PopAncestry(**t, population_names=['a', 'a'])
+
+	def test_ancestor_summary(self):
+		at = self.p.ancestry_table.assign(length=lambda t: t.right - t.left)
+		ans = at.groupby('ancestor').agg(population=('population', 'first'),
+			num_samples=('sample', 'nunique'), length=('length', 'sum'))
+		pd.testing.assert_frame_equal(self.p.ancestor_summary(), ans,
+			check_dtype=False, check_index_type=False)
+		assert list(self.p.ancestor_summary().index) == self.p.ancestors
+
+	def test_ancestor_coverage(self):
+		at = self.p.ancestry_table.assign(length=lambda t: t.right - t.left)
+		ans = at.groupby(['ancestor', 'sample'])['length'].sum().reset_index()
+		pd.testing.assert_frame_equal(self.p.ancestor_coverage(), ans, check_dtype=False)
+		t = tspop.PopAncestry(left=[], right=[], population=[], ancestor=[],
+			child=[], sample_nodes=[], sequence_length=1)
+		assert len(t.ancestor_summary()) == 0 and len(t.ancestor_coverage()) == 0
+
+	def test_ancestor_coverage_matrix(self):
+		pytest.importorskip('scipy')
+		matrix, ancestors, sample_ids = self.p.ancestor_coverage_matrix()
+		assert matrix.shape == (self.p.num_ancestors, len(sample_ids))
+		c = self.p.ancestor_coverage()
+		dense = matrix.toarray()
+		np.testing.assert_array_equal(dense[np.searchsorted(ancestors, c.ancestor),
+			np.searchsorted(sample_ids, c['sample'])], c.length)
+		assert np.isclose(dense.sum(), self.p.coverage)
+
+	def test_tract_lengths(self):
+		st = self.p.squashed_table
+		np.testing.assert_array_equal(self.p.tract_lengths(), st.right - st.left)
+		rate_map = msprime.RateMap(
+			position=[0, 5e6, self.ts_ex.sequence_length], rate=[1e-8, 3e-8])
+		cm = self.p.tract_lengths(rate_map=rate_map)
+		assert pytest.approx(cm.sum()) == 100 * rate_map.total_mass * self.p.num_samples
+
+	def test_tract_length_histogram(self):
+		st = self.p.squashed_table
+		lengths = st.right - st.left
+		bins = [0, 1e5, 1e6, 1e7]
+		h = self.p.tract_length_histogram(bins)
+		assert list(h.index) == [0, 1]
+		for pop in [0, 1]:
+			ans, _ = np.histogram(lengths[st.population == pop], bins=bins)
+			np.testing.assert_array_equal(h.loc[pop].to_numpy(), ans)
+		h = self.p.tract_length_histogram(bins, by=['sample', 'population'])
+		assert h.to_numpy().sum() == len(st)
+		assert h.loc[(3, 1)].sum() == sum((st['sample'] == 3) & (st.population == 1))
+		with pytest.raises(ValueError):
+			self.p.tract_length_histogram(bins, by='ancestor')
+
+	def test_tract_length_mean_and_quantiles(self):
+		st = self.p.squashed_table.assign(length=lambda d: d.right - d.left)
+		mean = self.p.mean_tract_length(by='sample')
+		ans = st.groupby('sample')['length'].mean()
+		np.testing.assert_allclose(mean.to_numpy(), ans.to_numpy())
+		q = [0, 0.1, 0.5, 1]
+		quantiles = self.p.tract_length_quantiles(q)
+		for pop in [0, 1]:
+			ans = np.quantile(st.length[st.population == pop], q)
+			np.testing.assert_allclose(quantiles.loc[pop].to_numpy(), ans)
+
+	def test_windowed_ancestry(self):
+		L = self.ts_ex.sequence_length
+		windows = np.linspace(0, L, 11)
+		st = self.p.squashed_table
+		w = self.p.windowed_ancestry(windows)
+		ws = self.p.windowed_ancestry(windows, by_sample=True)
+		assert w.shape == (10, 2)
+		assert ws.shape == (10, 2, self.p.num_samples)
+		np.testing.assert_allclose(ws.mean(axis=2), w)
+		np.testing.assert_allclose(w.sum(axis=1), 1)
+		# Compare with overlapping each tract with each window.
+		for i, s in enumerate(self.p.samples[:5]):
+			for j in range(10):
+				for pop in [0, 1]:
+					t = st[(st['sample'] == s) & (st.population == pop)]
+					overlap = np.clip(np.minimum(t.right, windows[j + 1])
+						- np.maximum(t.left, windows[j]), 0, None).sum()
+					assert pytest.approx(ws[j, pop, i]) == overlap / (L / 10)
+
+	def test_windowed_ancestry_gaps(self):
+		t = tspop.PopAncestry(
+			left=[2, 6, 0], right=[4, 8, 10], population=[1, 0, 0],
+			ancestor=[7, 6, 5], child=[0, 0, 1],
+			sample_nodes=[0, 1, 2], sequence_length=10)
+		w = t.windowed_ancestry([0, 5, 10], by_sample=True)
+		np.testing.assert_allclose(w[:, :, 0], [[0, 0.4], [0.4, 0]])
+		np.testing.assert_allclose(w[:, :, 1], [[1, 0], [1, 0]])
+		np.testing.assert_allclose(w[:, :, 2], 0)
+		np.testing.assert_allclose(t.windowed_ancestry([0, 5, 10]), w.mean(axis=2))
+
+	def test_concat_windows(self):
+		L = self.ts_ex.sequence_length
+		chunks = list(tspop.iter_pop_ancestry(
+			self.ts_ex, self.census_time, [0, L / 3, L / 2, L]))
+		p = tspop.concat(chunks)
+		pd.testing.assert_frame_equal(p.ancestry_table, self.p.ancestry_table)
+		pd.testing.assert_frame_equal(p.squashed_table, self.p.squashed_table)
+		assert p.ancestors == self.p.ancestors
+		assert p.ancestral_pops == self.p.ancestral_pops
+		assert pytest.approx(p.coverage) == self.p.coverage
+		assert list(p.samples) == list(self.p.samples)
+
+	def test_merge_disjoint_samples(self):
+		at = self.p.ancestry_table
+		a = at[at['sample'].isin([0, 1, 2])]
+		b = at[at['sample'].isin([3, 4])]
+		def make(t, samples):
+			return tspop.PopAncestry(left=t.left, right=t.right,
+				population=t.population, ancestor=t.ancestor, child=t['sample'],
+				sample_nodes=samples, sequence_length=self.p._sequence_length)
+		p = make(b, [3, 4]).merge(make(a, [0, 1, 2]))
+		assert list(p.samples) == [3, 4, 0, 1, 2]
+		st = self.p.squashed_table
+		ans = st[st['sample'] < 5].reset_index(drop=True)
+		pd.testing.assert_frame_equal(p.squashed_table, ans)
+
+	def test_concat_keys(self, tmp_path):
+		L = self.ts_ex.sequence_length
+		p = tspop.concat([self.p, self.p], keys=['chr1', 'chr2'], key_name='chromosome')
+		st = p.squashed_table
+		assert list(st.columns) == ['chromosome', 'sample', 'left', 'right', 'population']
+		assert len(st) == 2 * len(self.p.squashed_table)
+		for key in ['chr1', 'chr2']:
+			sub = st[st.chromosome == key].drop(columns='chromosome').reset_index(drop=True)
+			pd.testing.assert_frame_equal(sub, self.p.squashed_table)
+		assert p.total_genome_length == 2 * self.p.total_genome_length
+		assert pytest.approx(p.coverage) == 2 * self.p.coverage
+		# The lazily squashed table does not join tracts across keys either.
+		p._squashed_columns = None
+		p._squashed_table = None
+		assert len(p.squashed_table) == len(st)
+		p.dump(tmp_path)
+		q = tspop.load(tmp_path)
+		assert q.keys == ['chr1', 'chr2']
+		pd.testing.assert_frame_equal(q.ancestry_table, p.ancestry_table)
+
+	def test_concat_errors(self):
+		with pytest.raises(ValueError):
+			tspop.concat([self.p, self.p])
+		with pytest.raises(ValueError):
+			tspop.concat([])
+		with pytest.raises(ValueError):
+			tspop.concat([self.p, self.p], keys=['chr1'])
+
 	def test_subset_tables(self):
 		a, s = self.p.subset_tables(subset_samples=[0, 1])
 		assert len(set(a['sample'])) == 2
 		assert len(set(s['sample'])) == 2
+
+	def test_subset_tables_not_inplace(self):
+		p = tspop.get_pop_ancestry(self.ts_ex, self.census_time)
+		at = p.ancestry_table
+		a, s = p.subset_tables(subset_samples=[4, 1, 7])
+		assert p.ancestry_table is at
+		assert p.num_samples == self.p.num_samples
+		ans = at[at['sample'].isin([1, 4, 7])].reset_index(drop=True)
+		pd.testing.assert_frame_equal(a, ans)
+		st = p.squashed_table
+		ans = st[st['sample'].isin([1, 4, 7])].reset_index(drop=True)
+		pd.testing.assert_frame_equal(s, ans)
+
+	def test_subset_tables_inplace(self):
+		p = tspop.get_pop_ancestry(self.ts_ex, self.census_time)
+		assert p.subset_tables(subset_samples=[4, 1, 7], inplace=True) is None
+		assert set(p.ancestry_table['sample']) == {1, 4, 7}
+		assert set(p.squashed_table['sample']) == {1, 4, 7}
+		assert list(p.samples) == [1, 4, 7]
+		assert p.num_samples == 3
+		assert p.total_genome_length == 3 * self.ts_ex.sequence_length
+		st = p.squashed_table
+		assert pytest.approx(p.coverage) == sum(st.right - st.left)
+
+	def test_subset_is_view(self):
+		p = self.p.subset([2, 3, 4])
+		assert np.shares_memory(p.left, self.p.left)
+		assert p.ancestral_pops == [0, 1]
+		assert len(self.p.subset([]).left) == 0
 	
 
+class TestImport:
+	"""Tests that optional dependencies are imported on first use."""
+
+	def test_import_is_lazy(self):
+		code = ("import sys, tspop; "
+			"print('matplotlib' in sys.modules, 'pandas' in sys.modules)")
+		out = subprocess.run([sys.executable, '-c', code],
+			capture_output=True, text=True, check=True).stdout
+		assert out.split() == ['False', 'False']
+
+class TestCommandLine:
+	"""Tests the tspop command line program."""
+
+	(ts_ex, census_time) = sim_ts()
+	p = tspop.get_pop_ancestry(ts_ex, census_time)
+
+	def write_trees(self, tmp_path, num_files):
+		paths = [str(tmp_path / f'sim{j}.trees') for j in range(num_files)]
+		for path in paths:
+			self.ts_ex.dump(path)
+		return paths
+
+	def test_csv(self, tmp_path, capsys):
+		paths = self.write_trees(tmp_path, 3)
+		out = tmp_path / 'out'
+		assert tspop.main(paths + ['-c', str(self.census_time), '-o', str(out),
+			'-j', '2']) == 0
+		report = pd.read_csv(io.StringIO(capsys.readouterr().out), sep='\t')
+		assert sorted(report['file']) == paths
+		assert np.all(report['rows'] == len(self.p.sample))
+		assert np.all(report['ancestry_seconds'] >= 0)
+		for j in range(3):
+			t = pd.read_csv(out / f'sim{j}.squashed.csv')
+			pd.testing.assert_frame_equal(t, self.p.squashed_table, check_dtype=False)
+
+	def test_sample_selection(self, tmp_path, capsys):
+		paths = self.write_trees(tmp_path, 1)
+		out = tmp_path / 'out'
+		assert tspop.main(paths + ['-c', str(self.census_time), '-o', str(out),
+			'-s', '4', '2', '3', '-f', 'ancestry', '--compression', 'gzip']) == 0
+		t = pd.read_csv(out / 'sim0.ancestry.csv.gz')
+		expected = self.p.subset([2, 3, 4]).ancestry_table
+		pd.testing.assert_frame_equal(t, expected, check_dtype=False)
+		assert tspop.main(paths + ['-c', str(self.census_time), '-o', str(out),
+			'-p', 'ADMIX', '-f', 'dump', '--compact']) == 0
+		p = tspop.load(out / 'sim0.tspop', mmap=False)
+		assert p.population_names == ['SMALL', 'BIG', 'ADMIX', 'ANC']
+		np.testing.assert_array_equal(p.left, self.p.left)
+		np.testing.assert_array_equal(p.ancestor, self.p.ancestor)
+
+	def test_errors(self, tmp_path, capsys):
+		paths = self.write_trees(tmp_path, 1)
+		missing = str(tmp_path / 'missing.trees')
+		out = str(tmp_path / 'out')
+		assert tspop.main([missing] + paths + ['-c', str(self.census_time),
+			'-o', out]) == 1
+		captured = capsys.readouterr()
+		assert missing in captured.err
+		assert len(captured.out.splitlines()) == 2
+		# The test tree sequence has no sites.
+		assert tspop.main(paths + ['-c', str(self.census_time), '-o', out,
+			'-f', 'msp']) == 1
+		assert tspop.main(paths + ['-c', str(self.census_time), '-o', out,
+			'-p', 'NOWHERE']) == 1
+		with pytest.raises(SystemExit):
+			tspop.main(paths + ['-c', str(self.census_time), '-f', 'dump',
+				'--compression', 'gzip'])
+
 class TestPlots:
 	"""Tests karyotype plotting."""
 
@@ -112,6 +780,47 @@ class TestPlots:
 			# outfile="myfile.png",
 			)
 
+	def test_karyotype_many_samples(self, tmp_path):
+		pop_table = tspop.get_pop_ancestry(self.ts_ex, self.census_time)
+		samples = [0, 1, 2, 3]
+		fig = pop_table.plot_karyotypes(samples, outfile=tmp_path / "k.png")
+		assert len(fig.axes) == 4
+		st = pop_table.squashed_table
+		for ax, s in zip(fig.axes, samples):
+			assert len(ax.collections) == 1
+			assert len(ax.collections[0].get_paths()) == sum(st['sample'] == s)
+		assert (tmp_path / "k.png").exists()
+
+	def test_karyotype_min_tract_pixels(self, tmp_path):
+		pop_table = tspop.get_pop_ancestry(self.ts_ex, self.census_time)
+		fig = pop_table.plot_karyotypes([0], outfile=tmp_path / "k.png",
+			width=1, min_tract_pixels=5)
+		st = pop_table.squashed_table
+		st = st[st['sample'] == 0]
+		paths = fig.axes[0].collections[0].get_paths()
+		assert len(paths) < len(st)
+		# Narrow tracts are merged into their neighbours, leaving no gaps.
+		x = np.array([p.vertices[:, 0] for p in paths])
+		assert x[:, :4].min(axis=1)[0] == st['left'].min()
+		assert np.all(x[1:, :4].min(axis=1) == x[:-1, :4].max(axis=1))
+		assert x[-1, :4].max() == st['right'].max()
+
+	def test_merge_narrow_tracts(self):
+		left = np.array([0, 1, 1.5, 5, 9, 10, 20, 20.5])
+		right = np.array([1, 1.5, 5, 9, 10, 12, 20.5, 21])
+		pop = np.array([0, 1, 0, 1, 0, 1, 0, 1])
+		l, r, p = tspop._merge_narrow_tracts(left, right, pop, 2)
+		np.testing.assert_array_equal(l, [0, 5, 10, 20])
+		np.testing.assert_array_equal(r, [5, 10, 12, 21])
+		np.testing.assert_array_equal(p, [0, 1, 1, 0])
+
+	def test_plot_genome(self, tmp_path):
+		pop_table = tspop.get_pop_ancestry(self.ts_ex, self.census_time)
+		fig = tspop.plot_genome([pop_table, pop_table], [0, 1],
+			chrom_labels=['A', 'B'], outfile=tmp_path / "g.png")
+		assert len(fig.axes) == 4
+		assert fig.axes[1].get_title() == 'B'
+
 class TestIbdSquash:
 	"""Tests the method for squashing the IBD segments obtained from
 	tskit.ibd_segments(). (ie. calculates ibd in a 'path-agnostic' way.)"""
@@ -221,3 +930,45 @@ class TestIbdSquash:
 			})
 		pd.testing.assert_frame_equal(ress[(0, 1)], ans)
 
+
+class TestIbdAncestry:
+	"""Tests the census-population labelling of IBD segments."""
+
+	(ts_ex, census_time) = sim_ts()
+	samples = [0, 1, 2, 3, 4, 5]
+	ibd = tspop.get_ibd_ancestry(ts_ex, census_time, within=samples)
+
+	def test_columns(self):
+		assert list(self.ibd.columns) == ['sample_a', 'sample_b', 'left', 'right',
+			'ancestor', 'census_ancestor', 'population']
+		assert len(self.ibd) > 0
+		assert all(self.ibd.left < self.ibd.right)
+		assert set(self.ibd.sample_a) | set(self.ibd.sample_b) <= set(self.samples)
+
+	def test_labels_match_trees(self):
+		census = set(self.ts_ex.samples(time=self.census_time)) | set(
+			u.id for u in self.ts_ex.nodes() if u.time == self.census_time)
+		for row in self.ibd.itertuples():
+			x = (row.left + row.right) / 2
+			tree = self.ts_ex.at(x)
+			u = row.ancestor
+			while u != tskit.NULL and u not in census:
+				u = tree.parent(u)
+			assert u == row.census_ancestor
+			if u != tskit.NULL:
+				assert self.ts_ex.node(u).population == row.population
+			assert tree.mrca(row.sample_a, row.sample_b) == row.ancestor
+
+	def test_path_aware(self):
+		aware = tspop.get_ibd_ancestry(
+			self.ts_ex, self.census_time, within=self.samples, path_aware=True)
+		assert len(aware) >= len(self.ibd)
+		assert pytest.approx(sum(aware.right - aware.left)) == sum(self.ibd.right - self.ibd.left)
+
+	def test_iter_ibd_ancestry(self):
+		chunks = list(tspop.iter_ibd_ancestry(
+			self.ts_ex, self.census_time, batch_size=4, samples=self.samples))
+		assert len(chunks) == 2
+		res = pd.concat(chunks, ignore_index=True)
+		pd.testing.assert_frame_equal(res, self.ibd)
+